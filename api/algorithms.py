@@ -13,12 +13,54 @@ from exceptions import *
 from datastore import dataStore
 import population
 
-from utils import relativedelta_to_decimal_years
+from utils import relativedelta_to_decimal_years, RecordTable
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
-pop_year = population.NpSingleYearPopulationModel(settings.CSV_POPULATION_PATH, check_or_create_pickle=True)
-pop_day = population.BicubicSplineDailyPopulationModel(pop_year)
+pop_year = population.NpSingleYearPopulationModel(settings.CSV_POPULATION_PATH, check_or_create_pickle=True, dtype=settings.POPULATION_DTYPE)
+
+# continents are groups of countries, which the daily models treat just like countries (see population.RegionGroupPopulationModel)
+CONTINENTS = dict((continent, [country for country in countries if country in pop_year.region_codes])
+                  for continent, countries in dataStore.continent_countries.groupby('CONTINENT').POPIO_NAME)
+
+# the actual countries, in the order of dataStore.countries: the regions that belong to a continent, which leaves out the world and
+# the UN aggregates
+COUNTRIES = [country for country in dataStore.countries
+             if any(country in countries for countries in CONTINENTS.values())]
+
+def continentRegion(continent):
+    """
+    Returns the name of the region group of a continent. The groups get a prefix of their own, as some continents share their names with
+    the UN aggregates of the population data (such as "Europe"), which are not the sums of the continent's countries.
+    """
+    return 'continent:' + continent
+
+CONTINENT_GROUPS = dict((continentRegion(continent), countries) for continent, countries in CONTINENTS.items())
+pop_regions = population.RegionGroupPopulationModel(pop_year, groups=CONTINENT_GROUPS, cache=population.ModelCache(
+    max_bytes=settings.MODEL_CACHE_MAX_BYTES,
+    policy=settings.MODEL_CACHE_POLICY,
+))
+
+def createModelCache():
+    return population.ModelCache(
+        max_bytes=settings.MODEL_CACHE_MAX_BYTES,
+        policy=settings.MODEL_CACHE_POLICY,
+        pinned=[pop_regions.region_code(region) for region in settings.MODEL_CACHE_PINNED_REGIONS],
+    )
+
+def createGroupCache():
+    return population.ModelCache(max_bytes=settings.GROUP_CACHE_MAX_BYTES, policy=settings.MODEL_CACHE_POLICY)
+
+pop_day = population.BicubicSplineDailyPopulationModel(pop_regions, cache=createModelCache(), dtype=settings.MODEL_DTYPE, group_cache=createGroupCache())
+if settings.DAILY_MODEL_MAX_PYRAMID_ERROR is not None:
+    pop_day.compress(settings.DAILY_MODEL_MAX_PYRAMID_ERROR / 100.0)
+pop_day_fast = population.LinearDailyPopulationModel(pop_regions, cache=createModelCache(), dtype=settings.MODEL_DTYPE, group_cache=createGroupCache())
+
+# the daily models that can be selected with the "mode" parameter
+DAILY_MODELS = {'accurate': pop_day, 'fast': pop_day_fast,}
+if settings.DAILY_MODEL_MODE not in DAILY_MODELS:
+    raise ImproperlyConfigured('DAILY_MODEL_MODE is %s, valid values are: %s' % (settings.DAILY_MODEL_MODE, ', '.join(sorted(DAILY_MODELS))))
 
 SEXES = {'male': 'M', 'female': 'F', 'unisex': 'All',}
 
@@ -35,10 +77,23 @@ def inPosixDays(date):
     :return: the corresponding 'posix days' to the given datetime object
     """
     return (date - POSIX_EPOCH).days
+
+def dailyModel(mode=None):
+    """
+    Returns the daily population model for the given mode, or for the deployment's default mode if none is given.
+
+    :param mode: 'accurate', 'fast' or None
+    :return: a DailyPopulationModel instance
+    """
+    if not mode:
+        return DAILY_MODELS[settings.DAILY_MODEL_MODE]
+    if mode not in DAILY_MODELS:
+        raise InvalidModeError(mode)
+    return DAILY_MODELS[mode]
 ###
 ### 
 
-def worldPopulationRankByDate(sex, region, dob, refdate):
+def worldPopulationRankByDate(sex, region, dob, refdate, mode=None):
     """
     my rank by date: What will be my rank on particular day
 
@@ -46,6 +101,7 @@ def worldPopulationRankByDate(sex, region, dob, refdate):
     :param region:
     :param dob:
     :param refdate:
+    :param mode: the daily model to use, see dailyModel()
     :return:
     """
     # check that all arguments have the right type (even though it's not very pythonic)
@@ -55,7 +111,7 @@ def worldPopulationRankByDate(sex, region, dob, refdate):
     # confirm that sex and region contain valid values
     if sex not in SEXES:
         raise InvalidSexError(sex)
-    if region not in dataStore.countries:
+    if region not in dataStore.countryCodes:
         raise InvalidCountryError(region)
 
     # check the various date requirements
@@ -67,7 +123,7 @@ def worldPopulationRankByDate(sex, region, dob, refdate):
     if (refdate - dob).days > 36500:
         raise CalculationTooWideError(refdate)
 
-    return pop_day.pop_sum_dob(
+    return dailyModel(mode).pop_sum_dob(
         population.to_epoch_days(refdate),
         region,
         SEXES[sex],
@@ -75,12 +131,101 @@ def worldPopulationRankByDate(sex, region, dob, refdate):
         dob_to = population.to_epoch_days(refdate)
     )
 
-def dateByWorldPopulationRank(sex, region, dob, rank):
+def worldPopulationRanksByCountry(sex, dob, refdate, mode=None):
+    """
+    my rank in every country: What would be my rank on a particular day, had I been born in each of the countries (see COUNTRIES, the
+    world and the UN aggregates are left out). The ranks of all countries are calculated together, from the same integral over the ages (see population.PopulationModel.pop_sum_dob_regions()).
+
+    :param mode: the daily model to use, see dailyModel()
+    :return: a RecordTable of the countries and ranks, ordered by the rank (and then by country)
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(sex, basestring) or not isinstance(dob, date) or not isinstance(refdate, date):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that sex contains a valid value
+    if sex not in SEXES:
+        raise InvalidSexError(sex)
+
+    # check the various date requirements
+    today = datetime.utcnow().date()
+    if dob < date(1920, 1, 1) or dob > today:
+        raise BirthdateOutOfRangeError(dob, 'between 1920-01-01 and today')
+    if refdate < date(1950, 1, 1) or refdate < dob:
+        raise CalculationDateOutOfRangeError(refdate, 'past 1950-01-01 and past the birthdate')
+    if (refdate - dob).days > 36500:
+        raise CalculationTooWideError(refdate)
+
+    ranks = dailyModel(mode).pop_sum_dob_regions(
+        population.to_epoch_days(refdate),
+        COUNTRIES,
+        SEXES[sex],
+        dob_from = population.to_epoch_days(dob),
+        dob_to = population.to_epoch_days(refdate)
+    )
+    order = np.argsort(ranks, kind='mergesort')
+    return RecordTable(['country', 'rank'], {'country': [COUNTRIES[index] for index in order], 'rank': ranks[order]})
+
+# the steps between the dates of a rank trajectory in months (or None for days), see worldPopulationRankTrajectory()
+STRIDES = {'day': None, 'month': 1, 'year': 12,}
+
+# the most ranks that can be looked up in one call of datesByWorldPopulationRanks(), and the largest rank (ranks are int64 arrays)
+MAX_RANKS = 100
+MAX_RANK = np.iinfo(np.int64).max
+
+def worldPopulationRankTrajectory(sex, region, dob, dateTo, stride, mode=None):
+    """
+    my rank over time: What is my rank on every day, month or year from my birth to a particular day. All the ranks are calculated in a
+    single pass over the dates, which are the dob plus whole strides, starting with the first date the model covers.
+
+    :param dateTo: the last date of the trajectory
+    :param stride: 'day', 'month' or 'year'
+    :param mode: the daily model to use, see dailyModel()
+    :return: a RecordTable of the dates and ranks
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(sex, basestring) or not isinstance(region, basestring) or not isinstance(dob, date) or not isinstance(dateTo, date) or \
+            not isinstance(stride, basestring):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that sex, region and stride contain valid values
+    if sex not in SEXES:
+        raise InvalidSexError(sex)
+    if region not in dataStore.countryCodes:
+        raise InvalidCountryError(region)
+    if stride not in STRIDES:
+        raise InvalidStrideError(stride)
+
+    # check the various date requirements
+    model = dailyModel(mode)
+    minDate, maxDate = [population.from_epoch_days(days) for days in model.get_date_range()]
+    today = datetime.utcnow().date()
+    if dob < date(1920, 1, 1) or dob > today:
+        raise BirthdateOutOfRangeError(dob, 'between 1920-01-01 and today')
+    if dateTo < minDate or dateTo > maxDate or dateTo < dob:
+        raise CalculationDateOutOfRangeError(dateTo, 'between %s and %s and past the birthdate' % (minDate, maxDate))
+    if (dateTo - dob).days > 36500:
+        raise CalculationTooWideError(dateTo)
+
+    months = STRIDES[stride]
+    if months is None:
+        days = np.arange(population.to_epoch_days(max(dob, minDate)), population.to_epoch_days(dateTo) + 1)
+    else:
+        # whole months are added to the dob, so that e.g. the monthly dates of someone born on the 31st are the last days of the months
+        count = ((dateTo.year - dob.year) * 12 + dateTo.month - dob.month) // months
+        dates = [dob + relativedelta(months=months * step) for step in range(count + 1)]
+        days = np.array([population.to_epoch_days(day) for day in dates if minDate <= day <= dateTo], dtype=np.int64)
+
+    ranks = model.pop_sum_dob_series(days, region, SEXES[sex], population.to_epoch_days(dob))
+    return RecordTable(['date', 'rank'], {'date': population.from_epoch_days_vec(days), 'rank': ranks})
+
+def dateByWorldPopulationRank(sex, region, dob, rank, mode=None):
     """
     finding the date for specific rank
 
     :param birth:
     :param wRank:
+    :param mode: the daily model to use, see dailyModel()
     :return:
     """
     # check that all arguments have the right type (even though it's not very pythonic)
@@ -90,14 +235,58 @@ def dateByWorldPopulationRank(sex, region, dob, rank):
     # confirm that sex and region contain valid values
     if sex not in SEXES:
         raise InvalidSexError(sex)
-    if region not in dataStore.countries:
+    if region not in dataStore.countryCodes:
+        raise InvalidCountryError(region)
+
+    # check the various date requirements
+    if dob < date(1920, 1, 1) or dob > date(2059, 12, 31):   # the end date has been chosen arbitrarily and is probably wrong
+        raise BirthdateOutOfRangeError(dob, 'between 1920-01-01 and 2059-12-31')
+
+    return population.from_epoch_days(dailyModel(mode).pop_sum_dob_inverse_date(rank, region, SEXES[sex], population.to_epoch_days(dob)))
+
+def datesByWorldPopulationRanks(sex, region, dob, ranks, mode=None):
+    """
+    finding the dates for many ranks at once, e.g. the milestones of 1, 2 and 3 billion people. All the ranks are looked up in the same
+    evaluation of the ranks over the lifetime (see population.PopulationModel.pop_sum_dob_inverse_dates()).
+
+    :param ranks: a list of ranks
+    :param mode: the daily model to use, see dailyModel()
+    :return: a RecordTable of the ranks and their dates, in the order of the ranks given, with None for the ranks not reached in the
+             period covered by the model
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(sex, basestring) or not isinstance(region, basestring) or not isinstance(dob, date) or \
+            not isinstance(ranks, (list, tuple)) or not all(isinstance(rank, (int, long)) for rank in ranks):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that sex, region and ranks contain valid values
+    if sex not in SEXES:
+        raise InvalidSexError(sex)
+    if region not in dataStore.countryCodes:
         raise InvalidCountryError(region)
+    if not ranks or len(ranks) > MAX_RANKS:
+        raise DataOutOfRangeError('%i ranks can not be processed, only 1 to %i ranks are supported' % (len(ranks), MAX_RANKS))
+    if min(ranks) < 0 or max(ranks) > MAX_RANK:
+        raise DataOutOfRangeError('The ranks %s can not be processed, only ranks from 0 to %i are supported' % (ranks, MAX_RANK))
 
     # check the various date requirements
     if dob < date(1920, 1, 1) or dob > date(2059, 12, 31):   # the end date has been chosen arbitrarily and is probably wrong
         raise BirthdateOutOfRangeError(dob, 'between 1920-01-01 and 2059-12-31')
 
-    return population.from_epoch_days(pop_day.pop_sum_dob_inverse_date(rank, region, SEXES[sex], population.to_epoch_days(dob)))
+    model = dailyModel(mode)
+    minDate, maxDate = model.get_date_range()
+    dob = population.to_epoch_days(dob)
+    dateFrom = max(dob, minDate)
+
+    # the ranks that are reached in the period, with the same bounds as population.PopulationModel.pop_sum_dob_inverse_date()
+    ranks = np.array(ranks, dtype=np.int64)
+    lowest, highest = model.pop_sum_dob_series([dateFrom, maxDate], region, SEXES[sex], dob)
+    reached = (ranks <= highest) & ((ranks >= lowest) | (ranks == 0))
+    dates = [None] * len(ranks)
+    if reached.any():
+        for index, day in zip(np.flatnonzero(reached), model.pop_sum_dob_inverse_dates(ranks[reached], region, SEXES[sex], dob, dateFrom)):
+            dates[index] = population.from_epoch_days(int(day))
+    return RecordTable(['rank', 'date'], {'rank': ranks, 'date': dates})
 
 def lifeExpectancyRemaining(sex, region, refdate, age):
     # check that all arguments have the right type (even though it's not very pythonic)
@@ -107,7 +296,7 @@ def lifeExpectancyRemaining(sex, region, refdate, age):
     # confirm that sex and region contain valid values
     if sex not in SEXES_LIFE_EXPECTANCY:
         raise InvalidSexError(sex)
-    if region not in dataStore.countries:
+    if region not in dataStore.countryCodes:
         raise InvalidCountryError(region)
 
     # check the various date requirements
@@ -189,7 +378,7 @@ def populationCount(country=None, age=None, year=None):
         raise TypeError('One or more arguments did not match the expected parameter type')
 
     # confirm that sex and region contain valid values
-    if country is not None and country not in dataStore.countries:
+    if country is not None and country not in dataStore.countryCodes:
         raise InvalidCountryError(country)
 
     # check the various date requirements
@@ -217,62 +406,154 @@ def populationCount(country=None, age=None, year=None):
     else:
         countries = dataStore.countries
 
-    results = []
-    for a in ages:
-        for y in years:
-            for c in countries:
-                results.append({
-                    'year': y,
-                    'age': a,
-                    'males': pop_year.pop_age(y, c, 'M', a),
-                    'females': pop_year.pop_age(y, c, 'F', a),
-                    'total': pop_year.pop_age(y, c, 'All', a),
-                    'country': c
-                })
-    return results
-
-def totalPopulation(country, refdate):
+    # one row per age, year and country (in this nesting order), with the populations read from the tensor in a single operation
+    grid = pop_year.pop_age_grid(years, countries, ['M', 'F', 'All'], ages)
+    rows = grid.shape[0] * grid.shape[1] * grid.shape[2]
+    return RecordTable(['year', 'age', 'males', 'females', 'total', 'country'], {
+        'year': np.tile(np.repeat(years, len(countries)), len(ages)),
+        'age': np.repeat(ages, len(years) * len(countries)),
+        'males': grid[..., 0].reshape(rows),
+        'females': grid[..., 1].reshape(rows),
+        'total': grid[..., 2].reshape(rows),
+        'country': countries * (len(ages) * len(years)),
+    })
+
+def totalPopulation(country, refdate, mode=None):
     # check that all arguments have the right type (even though it's not very pythonic)
     if not isinstance(country, basestring) or (not isinstance(refdate, date)):
         raise TypeError('One or more arguments did not match the expected parameter type')
 
     # confirm that sex and region contain valid values
-    if country not in dataStore.countries:
+    if country not in dataStore.countryCodes:
+        raise InvalidCountryError(country)
+
+    # check the various date requirements
+    if refdate < date(2013, 1, 1) or refdate > date(2022, 12, 31):
+        raise CalculationDateOutOfRangeError(refdate, 'between 2013-01-01 and 2022-12-31')
+
+    return dailyModel(mode).pop_sum_age(population.to_epoch_days(refdate), country, 'All')
+
+def totalPopulationSeries(country, dateFrom, dateTo, mode=None):
+    """
+    Calculates the total population of a country on every day from dateFrom to dateTo (inclusive), evaluating the model for all the
+    days at once.
+
+    :return: a list of dicts with the keys 'date' and 'population', one per day
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(country, basestring) or not isinstance(dateFrom, date) or not isinstance(dateTo, date):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that sex and region contain valid values
+    if country not in dataStore.countryCodes:
         raise InvalidCountryError(country)
 
+    # check the various date requirements
+    if dateFrom < date(2013, 1, 1) or dateFrom > date(2022, 12, 31):
+        raise CalculationDateOutOfRangeError(dateFrom, 'between 2013-01-01 and 2022-12-31')
+    if dateTo < dateFrom or dateTo > date(2022, 12, 31):
+        raise CalculationDateOutOfRangeError(dateTo, 'between %s and 2022-12-31' % dateFrom)
+
+    days = np.arange(population.to_epoch_days(dateFrom), population.to_epoch_days(dateTo) + 1)
+    populations = dailyModel(mode).pop_sum_age_series(days, country, 'All')
+    return [{'date': dateFrom + timedelta(days=offset), 'population': int(pop)} for offset, pop in enumerate(populations)]
+
+def continentPopulation(continent, refdate, mode=None):
+    """
+    Calculates the total population of all countries of a continent on a certain date.
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(continent, basestring) or (not isinstance(refdate, date)):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that the continent is valid
+    if continent not in CONTINENTS:
+        raise InvalidContinentError(continent)
+
+    # check the various date requirements
+    if refdate < date(2013, 1, 1) or refdate > date(2022, 12, 31):
+        raise CalculationDateOutOfRangeError(refdate, 'between 2013-01-01 and 2022-12-31')
+
+    return dailyModel(mode).pop_sum_age(population.to_epoch_days(refdate), continentRegion(continent), 'All')
+
+def groupPopulation(countries, refdate, mode=None):
+    """
+    Calculates the total population of a group of countries on a certain date. The group is interpolated as a whole, by a model that is
+    the sum of the models of its countries (see population.DailyPopulationModel.get_group_model()).
+
+    :param countries: a list of countries
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(countries, (list, tuple)) or not all(isinstance(country, basestring) for country in countries) or not isinstance(refdate, date):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that all countries are valid
+    for country in countries:
+        if country not in dataStore.countryCodes:
+            raise InvalidCountryError(country)
+
     # check the various date requirements
     if refdate < date(2013, 1, 1) or refdate > date(2022, 12, 31):
         raise CalculationDateOutOfRangeError(refdate, 'between 2013-01-01 and 2022-12-31')
 
-    return pop_day.pop_sum_age(population.to_epoch_days(refdate), country, 'All')
+    return dailyModel(mode).pop_sum_age_group(population.to_epoch_days(refdate), countries, 'All')
 
 def continentBirthsByDate(continent, refdate):
-    pass
-#     # check that all arguments have the right type (even though it's not very pythonic)
-#     if not isinstance(continent, basestring) or (not isinstance(refdate, date)):
-#         raise TypeError('One or more arguments did not match the expected parameter type')
-#
-#     # confirm that sex and region contain valid values
-#     if continent not in dataStore.continent_countries:
-#         raise InvalidContinentError(continent)
-#
-#     # check the various date requirements
-#     if refdate < date(1950, 1, 1) or refdate > date(2100, 12, 31):
-#         raise CalculationDateOutOfRangeError(refdate, 'between 1950-01-01 and 2100-12-31')
-#
-#     refdateAsShortDateString = refdate.strftime('%y/%m/%d')
-#
-#     cntrys = dataStore.continent_countries.loc[Continent==continent,'POPIO_NAME']
-#
-#     #Population aged 0 at DATE
-#     births1 = dataStore.births_day_country.loc[refdateAsShortDateString,cntrys]
-#     #Population aged 0 at DATE+1
-#     births2 = dataStore.births_day_country.loc[refdateAsShortDateString+1,cntrys]
-#
-#     births_on_day = births2-births1
-#     births_on_day[births_on_day<0] = 0
-#
-#     return list(births_on_day)
+    """
+    Calculates the number of births on a certain date in every country of a continent.
+
+    :return: a list of dicts with the keys 'country' and 'births'
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(continent, basestring) or (not isinstance(refdate, date)):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that the continent is valid
+    if continent not in CONTINENTS:
+        raise InvalidContinentError(continent)
+
+    # check the various date requirements
+    births = dataStore.births_day_country
+    if not births.firstDay <= inPosixDays(refdate) <= births.lastDay:
+        raise CalculationDateOutOfRangeError(refdate, 'between %s and %s' % births.dateRange())
+
+    countries = births.knownCountries(CONTINENTS[continent])
+    birthsOnDay = births.births(inPosixDays(refdate), births.countryIds(countries))
+    return [{'country': country, 'births': float(value)} for country, value in zip(countries, birthsOnDay)]
+
+def birthsSeries(region, dateFrom, dateTo):
+    """
+    Calculates the number of births on every day from dateFrom to dateTo (inclusive) in a country or continent.
+
+    :return: a tuple of the total number of births, and a list of dicts with the keys 'date' and 'births', one per day
+    """
+    # check that all arguments have the right type (even though it's not very pythonic)
+    if not isinstance(region, basestring) or not isinstance(dateFrom, date) or not isinstance(dateTo, date):
+        raise TypeError('One or more arguments did not match the expected parameter type')
+
+    # confirm that the region is a valid country or continent, skipping the countries without births
+    births = dataStore.births_day_country
+    if region in CONTINENTS:
+        countries = births.knownCountries(CONTINENTS[region])
+    elif region in dataStore.countryCodes and region in births:
+        countries = [region]
+    else:
+        raise InvalidCountryError(region)
+
+    # check the various date requirements
+    dateIntervalText = 'between %s and %s' % births.dateRange()
+    if not births.firstDay <= inPosixDays(dateFrom) <= births.lastDay:
+        raise CalculationDateOutOfRangeError(dateFrom, dateIntervalText)
+    if dateTo < dateFrom or inPosixDays(dateTo) > births.lastDay:
+        raise CalculationDateOutOfRangeError(dateTo, dateIntervalText + ' and past the start date')
+
+    countryIds = births.countryIds(countries)
+    total = births.birthsSum(inPosixDays(dateFrom), inPosixDays(dateTo), countryIds).sum()
+    series = births.birthsSeries(inPosixDays(dateFrom), inPosixDays(dateTo), countryIds).sum(axis=1)
+    return float(total), [{'date': dateFrom + timedelta(days=offset), 'births': float(value)} for offset, value in enumerate(series)]
+
+def modelCacheStatistics():
+    return dict((mode, model.models.stats()) for mode, model in DAILY_MODELS.items())
 
 def calculateMortalityDistribution(country, sex, age):
     # check that all arguments have the right type (even though it's not very pythonic)
@@ -282,7 +563,7 @@ def calculateMortalityDistribution(country, sex, age):
     # confirm that sex and region contain valid values
     if sex not in SEXES_LIFE_EXPECTANCY:
         raise InvalidSexError(sex)
-    if country not in dataStore.countries:
+    if country not in dataStore.countryCodes:
         raise InvalidCountryError(country)
     age_float = relativedelta_to_decimal_years(age)
     if age_float > 120:
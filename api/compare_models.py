@@ -0,0 +1,177 @@
+'''
+Compares the accuracy and the speed of the daily population models over every region and sex,
+sharded over a pool of processes which load the models once each:
+
+    python compare_models.py [--processes 4] [--models bicubic,linear] [--oracle] [--output results.json]
+
+Run it from the api directory, like test_population.py. The errors are the ones of test_knots
+(the yearly populations of each single year of age on the enumeration dates, against the base
+data) and, with --oracle, the ones of test_milestones_oracle (the dates of population milestones,
+against the original implementation). Next to the errors, the number of evaluations per second of
+every model is reported, so that faster models can be judged on the same sweep.
+'''
+import argparse
+import datetime
+import json
+import multiprocessing
+import random
+import time
+from collections import OrderedDict
+from tabulate import tabulate
+
+import population
+
+CSV_PATH = "../data/WPP2012_INT_F3_Population_By_Sex_Annual_Single_100_Medium.csv"
+
+MODELS = OrderedDict([
+    ('bicubic', population.BicubicSplineDailyPopulationModel),
+    ('linear', population.LinearDailyPopulationModel),
+])
+
+# the models of a worker process, set up by load_models()
+worker = {}
+
+def load_models(model_names, oracle):
+    '''Load the base data and set up the models to compare, once per worker process.'''
+    pop_year = population.NpSingleYearPopulationModel(CSV_PATH, check_or_create_pickle=True)
+    worker['pop_year'] = pop_year
+    worker['models'] = OrderedDict((name, MODELS[name](pop_year)) for name in model_names)
+    if oracle:
+        import population_original
+        worker['oracle'] = population_original.OriginalDailyPopulationModel(pop_year)
+
+def compare_shard(shard):
+    '''Compare all models for one (region, sex), returns the rows of the result tables.'''
+    region, sex = shard
+    rows = {'knots': [], 'milestones': []}
+    for name, model in worker['models'].items():
+        start = time.time()
+        model.get_model(region, sex)
+        fit_seconds = time.time() - start
+        rows['knots'].append(knot_errors(name, model, region, sex, fit_seconds))
+        if 'oracle' in worker and sex in worker['oracle'].sexmap:
+            rows['milestones'].append(milestone_errors(name, model, region, sex))
+    return rows
+
+def knot_errors(name, model, region, sex, fit_seconds):
+    '''The errors of test_knots for one model, region and sex.'''
+    pop_year = worker['pop_year']
+    ages = pop_year.ages()
+    err_pc_max, err_pc_allage_max, err_sum_pc_max = 0.0, 0.0, 0.0
+    seconds = 0.0
+    for year in pop_year.dates():
+        year_pops = pop_year.pop_age_vec(year, region, sex, ages)
+        year_pop_allage = max(int(year_pops.sum()), 1)
+        date_days = population.to_epoch_days(datetime.date(year, 7, 1))
+
+        start = time.time()
+        day_pops = [model.pop_sum_age(date_days, region, sex, int(age * population.DAYS_PER_YEAR), int((age + 1) * population.DAYS_PER_YEAR - 1))
+                    for age in ages]
+        seconds += time.time() - start
+
+        errors = [abs(day_pop - year_pop) for day_pop, year_pop in zip(day_pops, year_pops)]
+        err_pc_max = max([err_pc_max] + [err / float(year_pop) for err, year_pop in zip(errors, year_pops) if year_pop > 0])
+        err_pc_allage_max = max(err_pc_allage_max, max(errors) / float(year_pop_allage))
+        err_sum_pc_max = max(err_sum_pc_max, sum(errors) / float(year_pop_allage))
+
+    return OrderedDict([
+        ('model', name),
+        ('region', region),
+        ('sex', sex),
+        ('max pyramid err %', round(err_sum_pc_max*100, 4)),
+        ('max hybrid err %', round(err_pc_allage_max*100, 2)),
+        ('max entry err %', round(err_pc_max*100, 2)),
+        ('fit ms', round(fit_seconds*1000, 2)),
+        ('evaluations', len(ages) * len(pop_year.dates())),
+        ('seconds', seconds),
+    ])
+
+def milestone_errors(name, model, region, sex):
+    '''The errors of test_milestones_oracle for one model, region and sex, over all its milestones.'''
+    oracle = worker['oracle']
+    dob_from = population.to_epoch_days(datetime.date(1970, 1, 1))
+    max_pop = worker['pop_year'].pop_sum_age(worker['pop_year'].get_date_range()[1], region, sex)
+    err_max, exceptions = 0, 0
+    seconds = 0.0
+    milestones = range(0, max_pop, max(max_pop / 5, 1))[:4]
+    for milestone in milestones:
+        try:
+            start = time.time()
+            day_pop = model.pop_sum_dob_inverse_date(milestone, region, sex, dob_from)
+            seconds += time.time() - start
+            oracle_pop = oracle.pop_sum_dob_inverse_date(milestone, region, sex, dob_from)
+        except Exception:
+            exceptions += 1
+            continue
+        err_max = max(err_max, abs(day_pop - oracle_pop))
+
+    return OrderedDict([
+        ('model', name),
+        ('region', region),
+        ('sex', sex),
+        ('max err (days)', err_max),
+        ('exceptions', exceptions),
+        ('evaluations', len(milestones) - exceptions),
+        ('seconds', seconds),
+    ])
+
+def summarize(rows, errors):
+    '''The worst errors and the overall evaluations per second of every model.'''
+    summary = OrderedDict()
+    for row in rows:
+        total = summary.setdefault(row['model'], OrderedDict([('model', row['model'])] + [(error, 0) for error in errors] + [('evaluations', 0), ('seconds', 0.0)]))
+        for error in errors:
+            total[error] = max(total[error], row[error])
+        total['evaluations'] += row['evaluations']
+        total['seconds'] += row['seconds']
+    for total in summary.values():
+        total['evaluations/s'] = int(total['evaluations'] / total['seconds']) if total['seconds'] else None
+    return summary.values()
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the accuracy and the speed of the daily population models.')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--models', default=','.join(MODELS), help='comma separated models to compare (default: %(default)s)')
+    parser.add_argument('--regions', type=int, default=0, help='number of randomly chosen regions to compare (default: all)')
+    parser.add_argument('--oracle', action='store_true', help='also compare the milestone dates with the original implementation (slow)')
+    parser.add_argument('--output', help='save the tables to this JSON file')
+    args = parser.parse_args()
+
+    model_names = args.models.split(',')
+    for name in model_names:
+        if name not in MODELS:
+            parser.error('unknown model %s, choose from %s' % (name, ', '.join(MODELS)))
+
+    # loading the data once before starting the workers also creates the pickle they load it from
+    pop_year = population.NpSingleYearPopulationModel(CSV_PATH, check_or_create_pickle=True)
+    regions = pop_year.get_regions()
+    if args.regions:
+        regions = random.sample(regions, min(args.regions, len(regions)))
+    shards = [(region, sex) for region in regions for sex in pop_year.get_sexes()]
+
+    start = time.time()
+    pool = multiprocessing.Pool(args.processes, initializer=load_models, initargs=(model_names, args.oracle))
+    try:
+        results = pool.map(compare_shard, shards, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print('Compared %i regions and sexes in %.1f seconds with %i processes' % (len(shards), time.time() - start, args.processes))
+
+    tables = OrderedDict()
+    tables['knots'] = sorted((row for result in results for row in result['knots']), key=lambda row: (row['model'], row['max pyramid err %']))
+    tables['knots summary'] = summarize(tables['knots'], ['max pyramid err %', 'max hybrid err %', 'max entry err %'])
+    if args.oracle:
+        tables['milestones'] = sorted((row for result in results for row in result['milestones']), key=lambda row: (row['model'], row['max err (days)']))
+        tables['milestones summary'] = summarize(tables['milestones'], ['max err (days)', 'exceptions'])
+
+    for title, table in tables.items():
+        print('\n' + title)
+        print(tabulate(table, headers='keys'))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(tables, file, indent=2)
+
+if __name__ == '__main__':
+    main()
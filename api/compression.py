@@ -0,0 +1,142 @@
+import gzip, io, mimetypes, os, re
+from django.conf import settings
+from django.http import HttpResponse, Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:   # brotli is optional, without it responses are only compressed with gzip
+    brotli = None
+
+
+# content types worth compressing, everything else (e.g. images) is sent as is
+COMPRESSIBLE_CONTENT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson', 'application/x-npy')
+
+ACCEPT_ENCODING_REGEX = re.compile(r'\s*([^\s;,]+)(?:\s*;\s*q\s*=\s*([0-9.]+))?')
+
+def acceptedEncodings(request):
+    """ Returns the set of content codings accepted by the client, as given by the Accept-Encoding header (ignoring those with q=0). """
+    encodings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        match = ACCEPT_ENCODING_REGEX.match(part)
+        if match:
+            try:
+                if float(match.group(2) or 1) > 0:
+                    encodings.add(match.group(1).lower())
+            except ValueError:
+                pass
+    return encodings
+
+def chooseEncoding(request, available):
+    """ Returns the best of the available encodings ('br', 'gzip') that the client accepts, or None. """
+    accepted = acceptedEncodings(request)
+    for encoding in available:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+def compress(content, encoding, level=6):
+    """ Compresses content with the given encoding ('br' or 'gzip') at a level from 1 (fastest) to 9 (smallest). """
+    if encoding == 'br':
+        return brotli.compress(content, quality=level)
+    buffer = io.BytesIO()
+    with gzip.GzipFile(mode='wb', compresslevel=level, fileobj=buffer, mtime=0) as gzipFile:
+        gzipFile.write(content)
+    return buffer.getvalue()
+
+def encodings():
+    """ The encodings this server can produce, in order of preference. """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class CompressionMiddleware(object):
+    """ Compresses response bodies of at least settings.COMPRESSION_MIN_BYTES with brotli or gzip, whichever the client prefers of the two
+        (brotli only if the brotli package is installed). Smaller bodies are sent as they are, as compressing them saves less than it costs.
+        Streamed responses are compressed with gzip on the fly. Replaces django.middleware.gzip.GZipMiddleware, and likewise has to come
+        first in MIDDLEWARE_CLASSES, so that it sees the response as the other middleware leaves it.
+    """
+
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.has_header('Content-Encoding') or response.status_code != 200:
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return response
+
+        if response.streaming:
+            if chooseEncoding(request, ('gzip',)) is None:
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+            response['Content-Encoding'] = 'gzip'
+            return response
+
+        if len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+        encoding = chooseEncoding(request, encodings())
+        if encoding is None:
+            return response
+        # quick levels for dynamic content, as the response time matters more than the last few percent of size
+        compressed = compress(response.content, encoding, level=4 if encoding == 'br' else 6)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'"$', r';%s"' % encoding, response['ETag'])
+        return response
+
+
+class PrecompressedFiles(object):
+    """ An in-memory copy of some static files, together with their compressed versions, which are built once when the files are loaded
+        (with the maximum compression level, as this is done only once). Serves them without touching the disk or compressing anything per
+        request. Files without an extension (such as the swagger resource listings) are served as JSON.
+    """
+
+    def __init__(self, root, directories, variables=None):
+        """
+        :param root: the local directory holding the static files
+        :param directories: the subdirectories of root to load, recursively
+        :param variables: a dict of placeholders (such as "{{BIRTHS_FIRST_DATE}}") to replace by their values in the files
+        """
+        self.files = {}
+        self.variables = variables or {}
+        for directory in directories:
+            for dirPath, dirNames, fileNames in os.walk(os.path.join(root, directory)):
+                for fileName in fileNames:
+                    path = os.path.join(dirPath, fileName)
+                    self.add(os.path.relpath(path, root).replace(os.sep, '/'), path)
+
+    def add(self, name, path):
+        with open(path, 'rb') as file:
+            content = file.read()
+        for placeholder, value in self.variables.items():
+            content = content.replace(placeholder, value)
+        contentType = mimetypes.guess_type(path)[0] or 'application/json'
+        versions = {None: content}
+        if contentType.startswith(COMPRESSIBLE_CONTENT_TYPES):
+            for encoding in encodings():
+                compressed = compress(content, encoding, level=9)
+                if len(compressed) < len(content):
+                    versions[encoding] = compressed
+        self.files[name] = (contentType, versions)
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def serve(self, request, name):
+        """ Returns the response for the file of the given name (relative to the root), in the best encoding the client accepts. """
+        try:
+            contentType, versions = self.files[name]
+        except KeyError:
+            raise Http404(name)
+        encoding = chooseEncoding(request, [encoding for encoding in encodings() if encoding in versions])
+        response = HttpResponse(versions[encoding], content_type=contentType)
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, public=True, max_age=settings.CACHE_CONTROL_MAXAGE)
+        return response
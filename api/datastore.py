@@ -1,10 +1,17 @@
-import os, time, logging
+import os, time, logging, tempfile
+from datetime import date, timedelta
+import numpy as np
 import pandas as pd
 from django.conf import settings
+from api.utils import SingleFlight, CodeRegistry
 
 
 logger = logging.getLogger(__name__)
 
+# the process umask, which can only be read by setting it; this is done once on import, before any threads write files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 class HDF5DataStore(object):
     """ Alternative data store implementation, based on the HDF5 format. Potentially faster than the current CSV/filesystem-based implementation, but
@@ -30,6 +37,7 @@ class HDF5DataStore(object):
         self.data = self._store.get('data')
         self.life_expectancy_ages = self._store.get('life_expectancy_ages')
         self.countries = pd.unique(self.data.Location).tolist()
+        self.countryCodes = CodeRegistry(self.countries)
         logger.info('Initialized data store in %.02f seconds', (time.clock()-start))
 
     def readCSVs(self):
@@ -37,6 +45,7 @@ class HDF5DataStore(object):
         self.data = pd.read_csv(settings.CSV_POPULATION_PATH)
         self.life_expectancy_ages = pd.read_csv(settings.CSV_LIFE_EXPECTANCY_PATH)
         self.countries = pd.unique(self.data.Location).tolist()
+        self.countryCodes = CodeRegistry(self.countries)
         self._store.put('data', self.data)
         self._store.put('life_expectancy_ages', self.life_expectancy_ages)
         logger.info('Parsed CSVs in %.02f seconds', (time.clock()-start))
@@ -75,12 +84,80 @@ class HDF5DataStore(object):
             return self.generateExtrapolationTable(sex, country)
 
 
+class DailyBirthsIndex(object):
+    """ The births per day and country, as a dense array indexed by posix day (days since 1970-01-01) and country id. The births on a day
+        are the increase of the population aged 0 from that day to the next (or zero if it decreases), as in modeling/python/yourRank.py.
+        The array holds the cumulative births since the first day, so that both the births on any day and the sum over any range of days
+        are a single subtraction per country.
+    """
+
+    POSIX_EPOCH = date(1970, 1, 1)
+
+    def __init__(self, firstDay, countries, populationAgedZero):
+        """
+        :param firstDay: the posix day of the first row of populationAgedZero
+        :param countries: the countries of the columns of populationAgedZero
+        :param populationAgedZero: a (day, country) array of the population aged 0 on every day
+        """
+        self.firstDay = firstDay
+        self.lastDay = firstDay + len(populationAgedZero) - 2   # the births on a day need the population of the next day
+        self.countries = list(countries)
+        self._countryIds = dict((country, countryId) for countryId, country in enumerate(self.countries))
+        births = np.maximum(np.diff(populationAgedZero, axis=0), 0)
+        self._cumulative = np.vstack((np.zeros((1, births.shape[1])), np.cumsum(births, axis=0)))
+
+    @classmethod
+    def fromCSV(cls, filename):
+        """ Reads the table of the population aged 0 by day, raising a ValueError unless it has exactly one row per day. """
+        table = pd.read_csv(filename, index_col=0)
+        days = pd.to_datetime(table.date1, format='%Y/%m/%d').values.astype('datetime64[D]').astype(np.int64)
+        gaps = np.flatnonzero(np.diff(days) != 1)
+        if len(gaps):
+            raise ValueError('The days of %s are not contiguous: %s follows %s' % (filename, table.date1.iloc[gaps[0] + 1], table.date1.iloc[gaps[0]]))
+        del table['date1']
+        return cls(int(days[0]), table.columns, table.values.astype(float))
+
+    def dateRange(self):
+        """ Returns the first and the last date (inclusive) of the births in the index. """
+        return self.POSIX_EPOCH + timedelta(self.firstDay), self.POSIX_EPOCH + timedelta(self.lastDay)
+
+    def __contains__(self, country):
+        return country in self._countryIds
+
+    def knownCountries(self, countries):
+        """ Returns the ones of the given countries that the index has births for, as not every country has a column in the births table. """
+        return [country for country in countries if country in self._countryIds]
+
+    def countryIds(self, countries):
+        """ Returns the array of the ids of the given countries, raising a KeyError for unknown countries. """
+        return np.array([self._countryIds[country] for country in countries], dtype=int)
+
+    def _rowIndex(self, day):
+        if not self.firstDay <= day <= self.lastDay:
+            raise IndexError('Day %i outside of the births table (%i to %i)' % (day, self.firstDay, self.lastDay))
+        return day - self.firstDay
+
+    def births(self, day, countryIds):
+        """ Returns the array of the births on the given posix day in each of the given countries. """
+        row = self._rowIndex(day)
+        return self._cumulative[row + 1, countryIds] - self._cumulative[row, countryIds]
+
+    def birthsSum(self, dayFrom, dayTo, countryIds):
+        """ Returns the array of the total births from dayFrom to dayTo (inclusive) in each of the given countries. """
+        return self._cumulative[self._rowIndex(dayTo) + 1, countryIds] - self._cumulative[self._rowIndex(dayFrom), countryIds]
+
+    def birthsSeries(self, dayFrom, dayTo, countryIds):
+        """ Returns the (day, country) array of the births on every day from dayFrom to dayTo (inclusive) in the given countries. """
+        return np.diff(self._cumulative[self._rowIndex(dayFrom):self._rowIndex(dayTo) + 2][:, countryIds], axis=0)
+
+
 class PickleDataStore(object):
     """ Data store implementation based on reading the base CSVs (population and life expectancy) into memory and then fetching
         the cached tables as pickle files with predefined filenames in a local filesystem path.
     """
 
     def __init__(self):
+        self._tableFlights = SingleFlight()
         logger.info('Reading base data CSVs...')
         self.readCSVs()
 
@@ -109,9 +186,12 @@ class PickleDataStore(object):
         self.continent_countries = pd.read_csv(settings.CSV_CONTINENT_COUNTRIES)
         
         # births per day by country 1950 - 2100
-        self.births_day_country = pd.read_csv(settings.CSV_BIRTHS_DAY_COUNTRY)
+        # ?, country 1, country 2, ..., date (Y/M/D)
+        self.births_day_country = DailyBirthsIndex.fromCSV(settings.CSV_BIRTHS_DAY_COUNTRY)
         
         self.countries = pd.unique(self.data.Location).tolist()
+        # hash-based validation of country names, in the order of self.countries
+        self.countryCodes = CodeRegistry(self.countries)
         logger.info('Parsed CSVs in %.02f seconds', (time.clock()-start))
 
     def __getitem__(self, item):
@@ -127,7 +207,18 @@ class PickleDataStore(object):
 
     def storeExtrapolationTable(self, sex, country, table):
         start = time.clock()
-        table.to_pickle(self._buildExtrapolationTableFilename(sex, country))
+        # write to a temporary file first and move it into place, so other processes never read a partially written table
+        path = self._buildExtrapolationTableFilename(sex, country)
+        fd, tempPath = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            table.to_pickle(tempPath)
+            # mkstemp() creates the file readable by its owner only; give the table the permissions of any other new file
+            os.chmod(tempPath, 0o666 & ~UMASK)
+            os.rename(tempPath, path)
+        except:
+            os.remove(tempPath)
+            raise
         logger.info('Stored extrapolation table for (%s, %s) in %.02f seconds', sex, country, time.clock()-start)
 
     def retrieveExtrapolationTable(self, sex, country):
@@ -146,6 +237,10 @@ class PickleDataStore(object):
         return table
 
     def getOrGenerateExtrapolationTable(self, sex, country):
+        # concurrent requests for the same table within this process share a single read or generation
+        return self._tableFlights.do(self._buildTableKey(sex, country), self._getOrGenerateExtrapolationTable, sex, country)
+
+    def _getOrGenerateExtrapolationTable(self, sex, country):
         path = self._buildExtrapolationTableFilename(sex, country)
         if os.path.exists(path):
             return self.retrieveExtrapolationTable(sex, country)
@@ -1,4 +1,4 @@
-from rest_framework.exceptions import ParseError
+from rest_framework.exceptions import APIException, ParseError
 from api.utils import offset_to_str
 
 
@@ -15,6 +15,14 @@ class InvalidContinentError(ParseError):
     def __init__(self, invalidValue):
         self.detail = '%s is an invalid value for the parameter "continent", the list of valid values can be retrieved from the endpoint /continent_countries' % invalidValue
 
+class InvalidModeError(ParseError):
+    def __init__(self, invalidValue):
+        self.detail = '%s is an invalid value for the parameter "mode", valid values are: accurate, fast' % invalidValue
+
+class InvalidStrideError(ParseError):
+    def __init__(self, invalidValue):
+        self.detail = '%s is an invalid value for the parameter "stride", valid values are: day, month, year' % invalidValue
+
 class DateParsingError(ParseError):
     def __init__(self, paramName, invalidValue):
         self.detail = 'The given date %s in parameter %s could not be parsed. Please provide dates in the format YYYY-MM-DD' % (invalidValue, paramName)
@@ -54,3 +62,8 @@ class AgeOutOfRangeError(ParseError):
 class DataOutOfRangeError(ParseError):
     def __init__(self, detail=None):
         self.detail = detail or 'The input data is out of range'
+
+class ComputationOverloadedError(APIException):
+    status_code = 503
+    def __init__(self):
+        self.detail = 'The server is too busy to process this calculation right now, please try again later'
@@ -0,0 +1,46 @@
+import timeit
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.test.client import Client
+from api.datastore import dataStore
+
+
+class Command(BaseCommand):
+    args = '[url ...]'
+    help = 'Measures the response time, encoding time and size of API endpoints (by default the largest /population/ tables) for several media types'
+    option_list = BaseCommand.option_list + (
+        make_option('--accept', action='append', dest='accept', help='Media type to request, may be given several times (default: JSON, NumPy and HTML)'),
+        make_option('--number', type='int', dest='number', default=20, help='Number of requests per measurement (default: 20)'),
+    )
+
+    def defaultUrls(self):
+        country = 'World' if 'World' in dataStore.countryCodes else dataStore.countries[0]
+        return [
+            '/1.0/population/2015/aged/30/',   # all countries
+            '/1.0/population/%s/30/' % country,   # all years
+            '/1.0/population/2015/%s/' % country,   # all ages
+        ]
+
+    def handle(self, *urls, **options):
+        import api.algorithms   # load the models before measuring
+        client = Client()
+        number = options['number']
+        self.stdout.write('%-45s %-25s %12s %12s %12s' % ('URL', 'Accept', 'Time [ms]', 'Encode [ms]', 'Size [bytes]'))
+        for url in urls or self.defaultUrls():
+            for accept in options['accept'] or ['application/json', 'application/x-npy', 'text/html']:
+                response = client.get(url, HTTP_ACCEPT=accept)
+                if response.status_code != 200:
+                    self.stdout.write('%-45s %-25s failed with status %i' % (url, accept, response.status_code))
+                    continue
+                # the best of three runs, as the other runs are mostly slowed down by unrelated load on the machine
+                seconds = min(timeit.repeat(lambda: client.get(url, HTTP_ACCEPT=accept), number=number, repeat=3)) / number
+                if response.streaming:
+                    # streamed responses are encoded while they are sent, so there is no separate encoding time
+                    self.stdout.write('%-45s %-25s %12.2f %12s %12i' % (url, accept, seconds * 1000, '-', len(''.join(response.streaming_content))))
+                    continue
+                encodeSeconds = min(timeit.repeat(lambda: self.encode(response), number=number, repeat=3)) / number
+                self.stdout.write('%-45s %-25s %12.2f %12.2f %12i' % (url, accept, seconds * 1000, encodeSeconds * 1000, len(response.content)))
+
+    def encode(self, response):
+        """ Renders the data of a response again, which measures the time spent in the renderer alone. """
+        return response.accepted_renderer.render(response.data, response.accepted_media_type, response.renderer_context)
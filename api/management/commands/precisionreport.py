@@ -0,0 +1,101 @@
+import random
+import numpy as np
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import population
+
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Compares the population calculations with smaller storage types against float64, and reports the memory the models take'
+    option_list = BaseCommand.option_list + (
+        make_option('--population-dtype', dest='populationDtype', default='int32', help='Storage type of the yearly population counts (default: int32)'),
+        make_option('--model-dtype', dest='modelDtype', default='float32', help='Storage type of the fitted daily models (default: float32)'),
+        make_option('--regions', type='int', dest='regions', default=0, help='Number of randomly chosen regions to compare (default: all)'),
+    )
+
+    # ages (in years) of the people whose ranks are compared
+    rankAges = (1, 18, 40, 70)
+
+    def handle(self, *args, **options):
+        from api.algorithms import CONTINENT_GROUPS
+
+        self.stdout.write('Loading the models with float64 and with %s/%s storage...' % (options['populationDtype'], options['modelDtype']))
+        reference = self.buildModels('float64', 'float64', CONTINENT_GROUPS)
+        reduced = self.buildModels(options['populationDtype'], options['modelDtype'], CONTINENT_GROUPS)
+
+        regions = reference['yearly'].get_regions()
+        if options['regions']:
+            regions = random.sample(regions, min(options['regions'], len(regions)))
+        minDate, maxDate = reference['accurate'].get_date_range()
+        dates = np.arange(minDate + 100, maxDate, 397)
+
+        self.stdout.write('%-45s %-9s %15s %15s' % ('Calculation (endpoints)', 'Mode', 'Max abs error', 'Max rel error'))
+        self.report('population table (/population/)', 'yearly', reference, reduced, self.populationTable, regions)
+        for mode in ('accurate', 'fast'):
+            calculations = (
+                ('total population (/population/<country>/)', lambda models, region, sex: self.totalPopulation(models[mode], region, sex, dates)),
+                ('population series', lambda models, region, sex: models[mode].pop_sum_age_series(dates, region, sex)),
+                ('rank by date (/wp-rank/<dob>/.../today/)', lambda models, region, sex: self.rankByDate(models[mode], region, sex, dates)),
+            )
+            for name, calculate in calculations:
+                self.report(name, mode, reference, reduced, calculate, regions)
+            self.reportDateByRank(mode, reference, reduced, regions, dates)
+
+        self.stdout.write('')
+        self.stdout.write('%-45s %15s %15s' % ('Memory [bytes]', 'float64', 'reduced'))
+        self.stdout.write('%-45s %15i %15i' % ('yearly population counts', reference['yearly'].base_model.tensor.nbytes, reduced['yearly'].base_model.tensor.nbytes))
+        for mode in ('accurate', 'fast'):
+            for models in (reference, reduced):
+                models[mode].build_all_models()
+            self.stdout.write('%-45s %15i %15i' % ('%s daily models' % mode, reference[mode].models.nbytes, reduced[mode].models.nbytes))
+
+    def buildModels(self, populationDtype, modelDtype, continents):
+        popYear = population.NpSingleYearPopulationModel(settings.CSV_POPULATION_PATH, check_or_create_pickle=True, dtype=populationDtype)
+        popRegions = population.RegionGroupPopulationModel(popYear, groups=continents)
+        return {
+            'yearly': popRegions,
+            'accurate': population.BicubicSplineDailyPopulationModel(popRegions, dtype=modelDtype),
+            'fast': population.LinearDailyPopulationModel(popRegions, dtype=modelDtype),
+        }
+
+    def populationTable(self, models, region, sex):
+        return np.array([models['yearly'].pop_age_vec(year, region, sex, models['yearly'].ages()) for year in models['yearly'].dates()])
+
+    def totalPopulation(self, model, region, sex, dates):
+        return np.array([model.pop_sum_age(date, region, sex) for date in dates])
+
+    def rankByDate(self, model, region, sex, dates):
+        return np.array([model.pop_sum_dob(date, region, sex, date - int(age * population.DAYS_PER_YEAR), date)
+                         for date in dates for age in self.rankAges])
+
+    def report(self, name, mode, reference, reduced, calculate, regions):
+        absError, relError = 0, 0.0
+        for region in regions:
+            for sex in reference['yearly'].get_sexes():
+                expected = calculate(reference, region, sex).astype(np.float64)
+                errors = np.abs(calculate(reduced, region, sex) - expected)
+                absError = max(absError, errors.max())
+                relError = max(relError, (errors / np.maximum(np.abs(expected), 1)).max())
+        self.stdout.write('%-45s %-9s %15i %14.6f%%' % (name, mode, absError, relError * 100))
+
+    def reportDateByRank(self, mode, reference, reduced, regions, dates):
+        """ Compares the dates on which people of the rankAges reach the rank they have on a few dates, in days. """
+        maxError, failures = 0, 0
+        for region in regions:
+            for sex in reference['yearly'].get_sexes():
+                for date in dates[::10]:
+                    for age in self.rankAges:
+                        dob = date - int(age * population.DAYS_PER_YEAR)
+                        rank = reference[mode].pop_sum_dob(date, region, sex, dob, date)
+                        if rank <= 0:
+                            continue
+                        dateFrom = max(dob, reference[mode].get_date_range()[0])
+                        expected = reference[mode].pop_sum_dob_inverse_date(rank, region, sex, dob, dateFrom)
+                        try:
+                            maxError = max(maxError, abs(reduced[mode].pop_sum_dob_inverse_date(rank, region, sex, dob, dateFrom) - expected))
+                        except ValueError:
+                            failures += 1
+        self.stdout.write('%-45s %-9s %10i days %15s' % ('date by rank (/wp-rank/<dob>/.../ranked/)', mode, maxError,
+                                                          '%i not found' % failures if failures else '-'))
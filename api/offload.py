@@ -0,0 +1,108 @@
+import atexit, logging, multiprocessing, threading, traceback
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from api.exceptions import ComputationOverloadedError
+
+
+logger = logging.getLogger(__name__)
+
+
+def _initializeWorker(warmRegions):
+    """ Runs once in every worker process: makes sure the models are loaded and the pinned regions are fitted before the first task. """
+    import api.algorithms
+    for region in warmRegions:
+        for sex in api.algorithms.SEXES.values():
+            api.algorithms.dailyModel().get_model(region, sex)
+
+def _runInWorker(func, args, kwargs):
+    """ Calls func in a worker process and returns (succeeded, result) in a form that can be sent back to the web process. """
+    try:
+        return True, func(*args, **kwargs)
+    except APIException as e:
+        # our API exceptions take custom constructor arguments and therefore can't be unpickled, so send the class and message instead
+        return False, (e.__class__, e.detail)
+    except Exception:
+        return None, traceback.format_exc()
+
+
+class ComputePool(object):
+    """ A pool of worker processes that the CPU-heavy calculations are sent to, so that they don't hold up the web workers serving cheap
+        requests. At most maxPending calculations may be running or queued at any time; further requests are rejected with a 503 right
+        away instead of piling up. A calculation that times out still counts until it has finished in its worker. Without any processes
+        configured, calculations simply run inline in the calling thread.
+    """
+
+    def __init__(self, processes=settings.COMPUTE_POOL_PROCESSES, maxPending=settings.COMPUTE_POOL_MAX_PENDING, timeout=settings.COMPUTE_POOL_TIMEOUT):
+        self.processes = processes
+        self.maxPending = maxPending or 2 * processes
+        self.timeout = timeout
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.maxPending) if processes else None
+        self._abandoned = []   # the results of the calculations that timed out, which hold their slots until they are ready
+        self._abandonedLock = threading.Lock()
+
+    def start(self):
+        """ Starts and warms up the worker processes. Should be called once per web worker, before it starts serving requests. """
+        if not self.processes or self._pool is not None:
+            return
+        self._pool = multiprocessing.Pool(self.processes, initializer=_initializeWorker, initargs=(settings.MODEL_CACHE_PINNED_REGIONS,))
+        atexit.register(self.stop)
+        logger.info('Started compute pool with %i processes and a queue depth of %i', self.processes, self.maxPending)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _reapAbandoned(self):
+        """ Frees the slots of the timed out calculations that have finished since. """
+        with self._abandonedLock:
+            running = []
+            for asyncResult in self._abandoned:
+                if asyncResult.ready():
+                    self._slots.release()
+                else:
+                    running.append(asyncResult)
+            self._abandoned = running
+
+    def run(self, func, *args, **kwargs):
+        """ Runs func(*args, **kwargs) in the pool (or inline if there is none) and returns its result, re-raising API exceptions. """
+        if self._pool is None:
+            return func(*args, **kwargs)
+
+        self._reapAbandoned()
+        if not self._slots.acquire(False):
+            raise ComputationOverloadedError()
+        try:
+            asyncResult = self._pool.apply_async(_runInWorker, (func, args, kwargs))
+        except:
+            self._slots.release()
+            raise
+        # the slot is freed once the calculation is done, whatever the outcome; a calculation we stop waiting for keeps it until then
+        finished = True
+        try:
+            succeeded, value = asyncResult.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            finished = False
+            logger.warning('Calculation %s%r did not finish within %i seconds', func.__name__, args, self.timeout)
+            raise ComputationOverloadedError()
+        finally:
+            if finished:
+                self._slots.release()
+            else:
+                with self._abandonedLock:
+                    self._abandoned.append(asyncResult)
+
+        if succeeded:
+            return value
+        elif succeeded is None:
+            raise RuntimeError('Calculation %s failed in a worker process:\n%s' % (func.__name__, value))
+        else:
+            exceptionClass, detail = value
+            exception = exceptionClass.__new__(exceptionClass)
+            exception.detail = detail
+            raise exception
+
+
+# the central compute pool instance, started by the WSGI application
+computePool = ComputePool()
@@ -25,7 +25,7 @@ class OriginalDailyPopulationModel(population.DailyPopulationModel):
         if dob_to != date:
             raise NotImplemented("Not implemented for the general case")
 
-        return population_original.worldPopulationRankByDate(
+        return worldPopulationRankByDate(
             self.sexmap[sex],
             region,
             population.from_epoch_days(dob_from),
@@ -43,13 +43,14 @@ class OriginalDailyPopulationModel(population.DailyPopulationModel):
 
 class PickleDataStore(object):
     """ Data store implementation based on reading the base CSVs (population and life expectancy) into memory and then fetching
-        the cached tables as pickle files with predefined filenames in a local filesystem path.
+        the cached tables as pickle files with predefined filenames in a local filesystem path. Tables are kept in memory once loaded.
     """
 
     def __init__(self):
         self.DATA_STORE_WRITABLE = True
         self.CSV_POPULATION_PATH = "../data/WPP2012_INT_F3_Population_By_Sex_Annual_Single_100_Medium.csv"
         self.DATA_STORE_PATH = os.path.dirname(os.path.abspath(self.CSV_POPULATION_PATH))
+        self.tables = {}
         self.readCSVs()
 
     def registerTableBuilder(self, builder):
@@ -69,7 +70,8 @@ class PickleDataStore(object):
         return '%s/%s' % (sex, country)
 
     def _buildExtrapolationTableFilename(self, sex, country):
-        key = '%s-%s' % (sex, country.replace(' ', '_'))
+        # the tables are indexed by posix day; the suffix keeps older tables indexed from 0 (with a date1 column) from being loaded
+        key = '%s-%s-days' % (sex, country.replace(' ', '_'))
         return os.path.join(self.DATA_STORE_PATH, key + '.pkl')
 
     def storeExtrapolationTable(self, sex, country, table):
@@ -86,22 +88,25 @@ class PickleDataStore(object):
         return table
 
     def getOrGenerateExtrapolationTable(self, sex, country):
-        path = self._buildExtrapolationTableFilename(sex, country)
-        if os.path.exists(path):
-            return self.retrieveExtrapolationTable(sex, country)
-        else:
-            return self.generateExtrapolationTable(sex, country)
+        key = self._buildTableKey(sex, country)
+        if key not in self.tables:
+            path = self._buildExtrapolationTableFilename(sex, country)
+            if os.path.exists(path):
+                self.tables[key] = self.retrieveExtrapolationTable(sex, country)
+            else:
+                self.tables[key] = self.generateExtrapolationTable(sex, country)
+        return self.tables[key]
 
 # the central data store instance we're gonna use
 dataStore = PickleDataStore()
 
 import math
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 
 import numpy as np
 import pandas as pd
-from scipy.interpolate import InterpolatedUnivariateSpline
+from scipy.interpolate import InterpolatedUnivariateSpline, splev
 
 from utils import relativedelta_to_decimal_years
 
@@ -112,6 +117,7 @@ AGE3 = [x*365+183 for x in range(0,100)]
 
 # Range of days (age)
 AGEOUT = range(0, 36501)
+AGEOUT_ARRAY = np.asarray(AGEOUT)
 
 SEXES = {'male': 'PopMale', 'female': 'PopFemale', 'unisex': 'PopTotal',}
 SEXES_LIFE_EXPECTANCY = {'male': 1, 'female': 2,}
@@ -135,92 +141,66 @@ def generateExtrapolationTable(sex, region):
     :return: an extrapolation table for the given region/sex tuple
     """
     pop1 = dataStore.data[dataStore.data.Location == region]
-    pop1 = pop1[['Time', 'Age', SEXES[sex]]]
-    # pop1 = data[['Time', 'Age', SEX]].query('Location' == CNTRY)
-    #print pop1
 
-    # pop1 now has {year, age, popn} for the given country and sex 1950-2100
+    # pop1 now has {year, age, popn} for the given country and sex 1950-2100, pivot it to one column of yearly population per age
+    popByAge = pop1.pivot(index='Time', columns='Age', values=SEXES[sex])
 
     july1from1950to2100 = [inPosixDays(date(y, 7, 1)) for y in xrange(1950, 2100+1)]
 
-    dateRange1950to2100inPosixDays = range(inPosixDays(date(1950,1,1)), inPosixDays(date(2100,12,31))+1)
-
-    ''' --- Date interpolation function --- '''
-    def dateInterp(iage):
-        """"
-        Given an empty column representing a single 5 year age band, interpolate external popn data
-        from yearly to daily data using splines, and return the daily population counts.
-        """
-        popi = np.asarray(pop1.loc[dataStore.data.Age == iage.name, SEXES[sex]])
-        # popi is now a single column of yearly population for a given age and sex
-
-        # spline interpolation function from Scipy Package
-        iuspl = InterpolatedUnivariateSpline(july1from1950to2100, popi, k=4)
-        return iuspl(dateRange1950to2100inPosixDays)
-
-    # --- store the results of the date interpolation --- #
-    result1 = pd.DataFrame(index = range(0,len(dateRange1950to2100inPosixDays)), columns = range(0,100))    
-    table = result1.apply(dateInterp, axis=0)
-
-    # Change column names by appending "age_"
-    oldHeaders = table.columns
-    newHeaders = []
-    for i in oldHeaders:
-        newHeaders.append("age" + "_" + str(i))
-    table.columns = newHeaders
-    #print result1.head # results: "age_0, age_1, ..."
-
-    # Convert the numerical days to date string
-    def toDate(d):
-        return (date(1970, 1, 1) + timedelta(days=d)).strftime('%Y-%m-%d')
-    toDate = np.vectorize(toDate) # vectorize the function to iterate over numpy ndarray
-    #fullDateRange = toDate(dateRange1970to2100inPosixDays) # 1st result: 1950-01-01
-    fullDateRange = len(dateRange1950to2100inPosixDays)*[None]
-    for i in range(0,len(dateRange1950to2100inPosixDays)):
-        fullDateRange[i] = toDate(dateRange1950to2100inPosixDays[i])
-
-    # Add the fullDateRange to the result1
-    table['date1'] = fullDateRange
-
-    # table will now be a crosstab of integer days (1950-2100) x single year of age (age_0-age_99)
-    # with a date type column appended
-
-    return table
+    dateRange1950to2100inPosixDays = np.arange(inPosixDays(date(1950,1,1)), inPosixDays(date(2100,12,31))+1)
+
+    # spline interpolation function from Scipy Package, one per age; all of them have the same knots
+    splines = [InterpolatedUnivariateSpline(july1from1950to2100, np.asarray(popByAge[age]), k=4) for age in range(0, 100)]
+    knots = splines[0].get_knots()
+    knots = np.concatenate(([knots[0]] * 4, knots, [knots[-1]] * 4))
+
+    # evaluate all of them with the same fitpack routine as the splines themselves would
+    daily = splev(dateRange1950to2100inPosixDays, (knots, [spline.get_coeffs() for spline in splines], 4))
+
+    # table will now be a crosstab of integer days (1950-2100) x single year of age (age_0-age_99), indexed by posix day
+    return pd.DataFrame(np.column_stack(daily), index=dateRange1950to2100inPosixDays, columns=['age_%i' % age for age in range(0, 100)])
     
 dataStore.registerTableBuilder(generateExtrapolationTable)   # TODO: not super nice architecture, but avoids the cyclic dependency for now
 
-def dayInterpA(table, date):
-    """
-    function that interpolates age in days
+# results of _dayInterpPopulation() by table and date, which the rank searches ask for over and over again
+DAY_INTERP_CACHE = population.ModelCache(max_bytes=256 * 1024 * 1024, sizeof=lambda entry: entry[1].nbytes)
 
-    :param table: the extrapolation table to use
-    :param date: the date
-    :return:
+def _dayInterpPopulation(table, date):
     """
-    iDate = date.strftime('%Y-%m-%d')
-    # age 0 to 99 - select a row containing popn by each single year of age for the given date
-    popi = table[table.date1 == iDate]
-
-    # Remove the columns for age 100 and the date1
-    popi = popi.iloc[:,0:100]
-
-    # store the popi results into an array for the interpolation
-    #popi = (np.asarray(popi)).tolist()
-    popi = np.asarray(popi)
+    Returns the population by single day of age (AGEOUT) on date as an array, see dayInterpA().
+    """
+    day = inPosixDays(date)
+    key = (id(table), day)
+    try:
+        cachedTable, pop = DAY_INTERP_CACHE.get(key)
+        if cachedTable is table:   # the id may have been reused by another table
+            return pop
+    except KeyError:
+        pass
+
+    # age 0 to 99 - select the row containing popn by each single year of age for the given date
+    popi = table.values[table.index.get_loc(day), 0:100]
 
     # Interpolate the age in Days
     # NOTE: this seems like a bad way to interpolate this - is it the case that
     # the spline-interpolate population over the days of a year will necessarily
     # add back up to the population in that year. Check this.
     iuspl2 = InterpolatedUnivariateSpline(AGE3, popi/365)
-    iuspl2_pred = iuspl2(AGEOUT)
+    pop = iuspl2(AGEOUT)
+    DAY_INTERP_CACHE.put(key, (table, pop))
+    return pop
+
+def dayInterpA(table, date):
+    """
+    function that interpolates age in days
 
-    # the output
+    :param table: the extrapolation table to use
+    :param date: the date
+    :return: a frame containing popn by single day of age for the given date
+    """
     merged = pd.DataFrame(index = range(0,len(AGEOUT)), columns = ['AGE','POP'])
     merged['AGE'] = AGEOUT
-    merged['POP'] = iuspl2_pred
-    
-    # CHECK: probably returns a frame containing popn by single day of age for the given date
+    merged['POP'] = _dayInterpPopulation(table, date)
     return merged
 
 def _calculateRankByDate(table, dob, date):
@@ -231,11 +211,8 @@ def _calculateRankByDate(table, dob, date):
     
     # do the interpolation
     iAge = inPosixDays(date) - inPosixDays(dob)   # age in days at date # FIXME: isn't this just (date - dob).days?
-    X = dayInterpA(table, date) # X is the entire population count by single day of age on date
-
-    # store age and pop in array
-    ageArray = np.asarray(X.AGE)
-    popArray = np.asarray(X.POP)
+    popArray = _dayInterpPopulation(table, date) # the entire population count by single day of age on date
+    ageArray = AGEOUT_ARRAY
 
     # calc cumulative sum of the population
     cumSum =  np.cumsum(popArray)
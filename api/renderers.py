@@ -0,0 +1,174 @@
+import json, datetime, io
+import numpy as np
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from api.utils import RecordTable
+
+
+class NumpyJSONEncoder(JSONEncoder):
+    """ JSON encoder that converts numpy scalars and arrays right away, before running through the generic conversions of DRF's encoder,
+        and that encodes RecordTables as lists of records.
+    """
+
+    def default(self, o):
+        if isinstance(o, np.generic):
+            return o.item()
+        elif isinstance(o, np.ndarray):
+            return o.tolist()
+        elif isinstance(o, RecordTable):
+            return list(o)
+        return super(NumpyJSONEncoder, self).default(o)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ JSON renderer for the large numeric responses of the API. Numpy values are encoded directly, and RecordTables are written row by row
+        from their columns, which are encoded once per column instead of once per value. Strings such as the country names are encoded once
+        per process and then reused.
+    """
+
+    encoder_class = NumpyJSONEncoder
+
+    # the number of records encoded at once when streaming a table
+    chunkRecords = 100
+
+    # encoded strings, shared by all renderer instances; the set of distinct strings in our tables is small and fixed
+    _encodedStrings = {}
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, RecordTable) and not self.get_indent(accepted_media_type, renderer_context or {}):
+            return '[' + ', '.join(self.encodeRecords(data)) + ']'
+        return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+    def renderStream(self, table):
+        """ Yields the JSON array of the records of a RecordTable in chunks, for a StreamingHttpResponse. """
+        separator = '['
+        for chunk in table.chunks(self.chunkRecords):
+            yield separator + ', '.join(self.encodeRecords(chunk))
+            separator = ', '
+        yield ']' if separator != '[' else '[]'
+
+    def encodeRecords(self, table):
+        """ Returns the list of the JSON objects encoding the records of a RecordTable. """
+        # the separators are the ones of json.dumps(), so that the output doesn't depend on the type of the data
+        template = '{' + ', '.join('%s: %%s' % json.dumps(field) for field in table.fields) + '}'
+        columns = [self.encodeColumn(table.columns[field]) for field in table.fields]
+        return [template % record for record in zip(*columns)]
+
+    def encodeColumn(self, column):
+        """ Returns the list of the JSON encodings of the values in column. """
+        if isinstance(column, np.ndarray):
+            if column.dtype.kind in 'iu':
+                return [str(value) for value in column.tolist()]
+            column = column.tolist()
+        return [self.encodeValue(value) for value in column]
+
+    def encodeValue(self, value):
+        if isinstance(value, basestring):
+            encoded = self._encodedStrings.get(value)
+            if encoded is None:
+                encoded = self._encodedStrings[value] = json.dumps(value, ensure_ascii=self.ensure_ascii)
+            return encoded
+        elif isinstance(value, (int, long)) and not isinstance(value, bool):
+            return str(value)
+        elif isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return '"%s"' % value.isoformat()
+        return json.dumps(value, cls=self.encoder_class, ensure_ascii=self.ensure_ascii)
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """ Renderer for newline delimited JSON (http://ndjson.org/): lists and RecordTables are written as one JSON document per line and
+        record, anything else as a single line. Clients can process the records of the large tables as they arrive.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        elif isinstance(data, RecordTable):
+            return ''.join(self.renderStream(data))
+        elif isinstance(data, list):
+            return ''.join(json.dumps(item, cls=self.encoder_class, ensure_ascii=self.ensure_ascii) + '\n' for item in data)
+        return json.dumps(data, cls=self.encoder_class, ensure_ascii=self.ensure_ascii) + '\n'
+
+    def renderStream(self, table):
+        """ Yields the lines of the records of a RecordTable in chunks, for a StreamingHttpResponse. """
+        for chunk in table.chunks(self.chunkRecords):
+            yield ''.join(record + '\n' for record in self.encodeRecords(chunk))
+
+
+class NpyRenderer(BaseRenderer):
+    """ Renderer for the NumPy .npy format, for clients that load the tables of the API into arrays anyway: a table is written as a
+        structured array with one field per column (integers as int64, decimals as float64, strings as UTF-8 bytes and dates as
+        datetime64[D]), which numpy.load() reads in a single copy, or numpy.frombuffer() without any. Tables are RecordTables and lists of
+        records, also when wrapped in a dict with a single key (as in {"mortality_distribution": [...]}). Any other data, including error
+        messages, is rendered as JSON with the JSON media type, since it has no array layout.
+    """
+
+    media_type = 'application/x-npy'
+    format = 'npy'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        table = self.findTable(data)
+        array = self.toArray(table) if table is not None else None
+        response = (renderer_context or {}).get('response')
+        if array is None or (response is not None and response.status_code >= 400):
+            fallback = FastJSONRenderer()
+            if response is not None:
+                response['Content-Type'] = fallback.media_type
+            return fallback.render(data, fallback.media_type, renderer_context)
+
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        return buffer.getvalue()
+
+    def findTable(self, data):
+        """ Returns the RecordTable held by data, or None if data is not tabular. """
+        if isinstance(data, dict) and len(data) == 1:
+            data = data.values()[0]
+        if isinstance(data, RecordTable):
+            return data
+        elif isinstance(data, list) and data and all(isinstance(record, dict) for record in data):
+            fields = sorted(data[0])
+            if all(sorted(record) == fields for record in data):
+                return RecordTable(fields, dict((field, [record[field] for record in data]) for field in fields))
+        return None
+
+    def toArray(self, table):
+        """ Returns the records of a RecordTable as a structured array, or None if a column has no array type (e.g. nested data). """
+        columns = [self.toColumn(table.columns[field]) for field in table.fields]
+        if any(column.dtype.kind == 'O' for column in columns):
+            return None
+        array = np.empty(len(table), dtype=[(str(field), column.dtype) for field, column in zip(table.fields, columns)])
+        for field, column in zip(table.fields, columns):
+            array[str(field)] = column
+        return array
+
+    def toColumn(self, column):
+        column = np.asarray(column)
+        if column.dtype.kind == 'i':
+            return column.astype(np.int64)
+        elif column.dtype.kind == 'f':
+            return column.astype(np.float64)
+        elif column.dtype.kind == 'U':
+            return np.char.encode(column, 'utf-8')
+        elif column.dtype.kind == 'O' and len(column) and isinstance(column[0], datetime.date):
+            return column.astype('datetime64[D]')
+        return column
+
+
+class FastContentNegotiation(DefaultContentNegotiation):
+    """ Content negotiation that picks the first renderer (JSON) right away for requests that don't ask for anything in particular, i.e.
+        API clients that send no Accept header, */* or exactly the first renderer's media type. Only the remaining requests (e.g. browsers
+        asking for text/html, or ?format=) run through the full negotiation over all renderers.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        if not format_suffix and self.settings.URL_FORMAT_OVERRIDE not in request.QUERY_PARAMS:
+            accept = request.META.get('HTTP_ACCEPT') or '*/*'
+            if accept in ('*/*', renderers[0].media_type):
+                return renderers[0], renderers[0].media_type
+        return super(FastContentNegotiation, self).select_renderer(request, renderers, format_suffix)
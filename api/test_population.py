@@ -6,6 +6,9 @@ import math
 import random
 import traceback
 import csv
+import threading
+import time
+import numpy as np
 from tabulate import tabulate
 from collections import defaultdict, OrderedDict
 
@@ -25,6 +28,7 @@ class TestDailyPopulationModel(unittest.TestCase):
         # Create the three population models
         self.pop_year = population.NpSingleYearPopulationModel("../data/WPP2012_INT_F3_Population_By_Sex_Annual_Single_100_Medium.csv", check_or_create_pickle=True)
         self.pop_day = population.BicubicSplineDailyPopulationModel(self.pop_year)
+        self.pop_day_linear = population.LinearDailyPopulationModel(self.pop_year)
         self.pop_oracle = population_original.OriginalDailyPopulationModel(self.pop_year)
 
     def test_dimensions(self):
@@ -43,41 +47,43 @@ class TestDailyPopulationModel(unittest.TestCase):
         regions = self.pop_year.get_regions()
 
         table = list()
-        for region in regions:
-            for sex in sexes:
-                err_pc_max = float("-inf")
-                err_pc_allage_max = float("-inf")
-                err_sum_pc_max = float("-inf")
-                for year in range(min_year, max_year+1):
-                    err_sum = 0
-                    year_pop_allage = self.pop_year.pop_sum_age(year, region, sex)
-                    date_days = population.to_epoch_days(datetime.date(year, 7, 1))
+        for model_name, pop_day in (('bicubic', self.pop_day), ('linear', self.pop_day_linear)):
+            for region in regions:
+                for sex in sexes:
+                    err_pc_max = float("-inf")
+                    err_pc_allage_max = float("-inf")
+                    err_sum_pc_max = float("-inf")
+                    for year in range(min_year, max_year+1):
+                        err_sum = 0
+                        year_pop_allage = self.pop_year.pop_sum_age(year, region, sex)
+                        date_days = population.to_epoch_days(datetime.date(year, 7, 1))
 
-                    for age_years in range(min_age_year, max_age_year+1):
-                        age_days_low = int(age_years * population.DAYS_PER_YEAR)
-                        age_days_high = int((age_years + 1) * population.DAYS_PER_YEAR - 1)
+                        for age_years in range(min_age_year, max_age_year+1):
+                            age_days_low = int(age_years * population.DAYS_PER_YEAR)
+                            age_days_high = int((age_years + 1) * population.DAYS_PER_YEAR - 1)
 
-                        year_pop = self.pop_year.pop_age(year, region, sex, age_years)
-                        day_pop = self.pop_day.pop_sum_age(date_days, region, sex, age_days_low, age_days_high)
+                            year_pop = self.pop_year.pop_age(year, region, sex, age_years)
+                            day_pop = pop_day.pop_sum_age(date_days, region, sex, age_days_low, age_days_high)
 
-                        err = abs(day_pop - year_pop)
-                        err_pc =  err / float(year_pop) if year_pop > 0 else 0
-                        err_pc_allage = err / float(year_pop_allage)
-                        err_sum += err
+                            err = abs(day_pop - year_pop)
+                            err_pc =  err / float(year_pop) if year_pop > 0 else 0
+                            err_pc_allage = err / float(year_pop_allage)
+                            err_sum += err
 
-                        err_pc_allage_max = max(err_pc_allage_max, err_pc_allage)
-                        err_pc_max = max(err_pc_max, err_pc)
+                            err_pc_allage_max = max(err_pc_allage_max, err_pc_allage)
+                            err_pc_max = max(err_pc_max, err_pc)
 
-                    err_sum_pc = err_sum / float(year_pop_allage)
-                    err_sum_pc_max = max(err_sum_pc_max, err_sum_pc)
+                        err_sum_pc = err_sum / float(year_pop_allage)
+                        err_sum_pc_max = max(err_sum_pc_max, err_sum_pc)
 
-                table += [OrderedDict([
-                    ('region', region),
-                    ('sex', sex),
-                    ('max pyramid err %', round(err_sum_pc_max*100,4)),
-                    ('max hybrid err %', round(err_pc_allage_max*100,2)),
-                    ('max entry err %', round(err_pc_max*100, 2))
-                ])]
+                    table += [OrderedDict([
+                        ('model', model_name),
+                        ('region', region),
+                        ('sex', sex),
+                        ('max pyramid err %', round(err_sum_pc_max*100,4)),
+                        ('max hybrid err %', round(err_pc_allage_max*100,2)),
+                        ('max entry err %', round(err_pc_max*100, 2))
+                    ])]
 
         print(tabulate(table, headers="keys"))
                 
@@ -150,26 +156,385 @@ class TestDailyPopulationModel(unittest.TestCase):
                 totalpop[region][enum_date] = float(pop)
                 
             table = list()
-            for region in sorted(totalpop):
-                max_pc_err = float("-inf")
-                max_err = float("-inf")
-                for enum_date in totalpop[region]:
-                    date_days = population.to_epoch_days(enum_date)
-                    day_pop_sum = self.pop_day.pop_sum_age(date_days, region, 'All')
-                    oracle_pop_sum = totalpop[region][enum_date]
-                    err = abs(day_pop_sum-oracle_pop_sum)
-                    pc_err = err/float(oracle_pop_sum)
-                    max_pc_err = max(max_pc_err, pc_err)
-                    max_err = max(max_err, err)
+            for model_name, pop_day in (('bicubic', self.pop_day), ('linear', self.pop_day_linear)):
+                for region in sorted(totalpop):
+                    max_pc_err = float("-inf")
+                    max_err = float("-inf")
+                    for enum_date in totalpop[region]:
+                        date_days = population.to_epoch_days(enum_date)
+                        day_pop_sum = pop_day.pop_sum_age(date_days, region, 'All')
+                        oracle_pop_sum = totalpop[region][enum_date]
+                        err = abs(day_pop_sum-oracle_pop_sum)
+                        pc_err = err/float(oracle_pop_sum)
+                        max_pc_err = max(max_pc_err, pc_err)
+                        max_err = max(max_err, err)
                     
-                table += [OrderedDict([
-                    ('region', region),
-                    ('max err', max_err),
-                    ('max err %', round(max_pc_err*100,4))
-                ])] 
+                    table += [OrderedDict([
+                        ('model', model_name),
+                        ('region', region),
+                        ('max err', max_err),
+                        ('max err %', round(max_pc_err*100,4))
+                    ])]
                 
-            table.sort(key=lambda x: x['max err %'])
+            table.sort(key=lambda x: (x['model'], x['max err %']))
             print(tabulate(table, headers="keys"))
-                
+
+    def test_pop_age_vec(self):
+        # Test that the vectorized evaluation agrees with the scalar one, including outside the age range
+        min_date, max_date = self.pop_day.get_date_range()
+        min_age, max_age = self.pop_day.get_age_range()
+        ages = list(range(min_age - 50, max_age + 50, 37))
+        for pop_day in (self.pop_day, self.pop_day_linear):
+            for region in sample(self.pop_year.get_regions(), 5):
+                for date_days in range(min_date, max_date, 4999):
+                    self.assertEqual(list(pop_day.pop_age_vec(date_days, region, 'All', ages)),
+                                     [pop_day.pop_age(date_days, region, 'All', age) for age in ages])
+
+        for region in sample(self.pop_year.get_regions(), 5):
+            for year in range(1950, 2101, 10):
+                self.assertEqual(self.pop_year.pop_sum_age(year, region, 'F', 10, 110),
+                                 sum(self.pop_year.pop_age(year, region, 'F', age) for age in range(10, 101)))
+
+    def test_region_groups(self):
+        # Test that groups add up their members, both in the yearly data and in the interpolation
+        regions = sample([region for region in self.pop_year.get_regions() if region != 'World'], 4)
+        pop_groups = population.RegionGroupPopulationModel(self.pop_year, groups={'Group': regions[:3]})
+        pop_day_groups = population.BicubicSplineDailyPopulationModel(pop_groups)
+        self.assertTrue('Group' in pop_groups.get_regions())
+
+        for year in range(1950, 2101, 30):
+            self.assertEqual(pop_groups.pop_sum_age(year, 'Group', 'M'), sum(self.pop_year.pop_sum_age(year, member, 'M') for member in regions[:3]))
+        date_days = population.to_epoch_days(datetime.date(2015, 3, 1))
+        self.assertAlmostEqual(pop_day_groups.pop_sum_age(date_days, 'Group', 'All'),
+                               sum(self.pop_day.pop_sum_age(date_days, member, 'All') for member in regions[:3]), delta=3)
+
+        self.assertRaises(ValueError, population.RegionGroupPopulationModel, self.pop_year, groups={'Group': [regions[0], 'Atlantis']})
+        self.assertRaises(ValueError, population.RegionGroupPopulationModel, self.pop_year, groups={regions[0]: regions[1:3]})
+
+    def test_group_models(self):
+        # Test that a group of regions is integrated once, with the sum of its members' models, which is kept per set of members
+        regions = sample([region for region in self.pop_year.get_regions() if region != 'World'], 3)
+        date_days = population.to_epoch_days(datetime.date(2015, 3, 1))
+        for pop_day in (self.pop_day, self.pop_day_linear):
+            expected = sum(pop_day.pop_sum_age(date_days, region, 'F') for region in regions)
+            integrals = []
+            pop_sum_age_model = pop_day.pop_sum_age_model
+            pop_day.pop_sum_age_model = lambda *args: integrals.append(args) or pop_sum_age_model(*args)
+            self.assertAlmostEqual(pop_day.pop_sum_age_group(date_days, regions, 'F'), expected, delta=len(regions))
+            self.assertEqual(len(integrals), 1)
+            pop_day.pop_sum_age_group(date_days, list(reversed(regions)) + regions[:1], 'F')
+            self.assertEqual(len(integrals), 2)
+            self.assertEqual(len(pop_day.group_models), 1)
+            del pop_day.pop_sum_age_model
+
+    def test_region_codes(self):
+        # Test that regions and groups get stable codes, shared by the daily models, and that models are cached by code
+        regions = sorted(self.pop_year.get_regions())
+        self.assertEqual([self.pop_year.region_code(region) for region in regions], range(len(regions)))
+        self.assertEqual(self.pop_day.region_code(regions[3]), 3)
+        self.assertEqual(self.pop_day.sex_code('F'), self.pop_year.get_sexes().index('F'))
+        self.assertRaises(KeyError, self.pop_year.region_code, 'Atlantis')
+
+        pop_groups = population.RegionGroupPopulationModel(self.pop_year, groups={'Group': regions[:2]})
+        pop_day_groups = population.LinearDailyPopulationModel(pop_groups)
+        self.assertEqual(pop_groups.region_code('Group'), len(regions))
+        self.assertTrue(pop_groups.sums.is_pinned((pop_groups.region_code('Group'), 0)))
+        self.assertRaises(KeyError, pop_groups.region_code, regions[1] + '+' + regions[2])
+
+        pop_day_groups.get_model('Group', 'M')
+        self.assertTrue((len(regions), pop_groups.sex_code('M')) in pop_day_groups.models)
+        self.assertEqual(len(pop_groups.get_regions()), len(regions) + 1)
+
+    def test_joint_fit(self):
+        # Test that fitting all regions at once gives the splines fitpack fits region by region
+        from scipy.interpolate import RectBivariateSpline
+        self.pop_day.build_all_models()
+        ages = range(0, 36000, 1000)
+        dates = range(self.pop_day.get_date_range()[0], self.pop_day.get_date_range()[1], 1500)
+        for region in sample(self.pop_year.get_regions(), 5):
+            for sex in self.pop_year.get_sexes():
+                reference = RectBivariateSpline(*self.pop_day.build_grid(region, sex))
+                model = self.pop_day.get_model(region, sex)
+                coefs = self.pop_day.coefficients[self.pop_day.region_code(region), self.pop_day.sex_code(sex)]
+                self.assertTrue((model.tck[2] == coefs.ravel()).all())
+                self.assertTrue(np.allclose(model.tck[2], reference.tck[2], rtol=1e-10, atol=1e-6))
+                self.assertTrue(np.allclose(model(ages, dates), reference(ages, dates), rtol=1e-10, atol=1e-6))
+
+    def test_batch_evaluation(self):
+        # Test that evaluating many regions at many points at once matches the single evaluations
+        regions = sample(self.pop_year.get_regions(), 5)
+        min_date, max_date = self.pop_day.get_date_range()
+        dates = [random.randint(min_date + 1, max_date - 1) for i in range(200)] + [min_date, max_date]
+        ages = [random.randint(-100, 37000) for i in range(200)] + [0, self.pop_day.get_age_range()[1]]
+        expected = [[self.pop_day.pop_age(date, region, 'F', age) for date, age in zip(dates, ages)] for region in regions]
+        self.assertEqual(self.pop_day.pop_age_regions(dates, regions, 'F', ages).tolist(), expected)
+        self.pop_day.build_all_models()
+        self.assertEqual(self.pop_day.pop_age_regions(dates, regions, 'F', ages).tolist(), expected)
+
+        # the age integrals at a date are the limits of the integrals over ever smaller windows around it
+        evaluator = self.pop_day.get_evaluator()
+        coefs = self.pop_day.get_coefficients(regions, 'M')
+        for date in sample(dates[:-2], 5):
+            integrals = evaluator.integral_x(coefs, 1000, 20000, date)[:, 0]
+            for region, integral in zip(regions, integrals):
+                window = self.pop_day.get_model(region, 'M').integral(1000, 20000, date - 0.001, date + 0.001) / 0.002
+                self.assertAlmostEqual(integral, window, delta=1e-6 * abs(integral) + 1e-3)
+
+    def test_exact_age_sum(self):
+        # Test that the bicubic age sums at a date are the limits of the integrals over ever smaller
+        # windows around it, also at the ends of the date range, and that the series agree with them
+        min_date, max_date = self.pop_day.get_date_range()
+        for region in sample(self.pop_year.get_regions(), 5):
+            model = self.pop_day.get_model(region, 'All')
+            for date in [min_date, max_date] + [random.randint(min_date + 1, max_date - 1) for i in range(5)]:
+                lower, upper = max(date - 0.001, min_date), min(date + 0.001, max_date)
+                window = model.integral(0, 36890, lower, upper) / (upper - lower)
+                self.assertAlmostEqual(self.pop_day.pop_sum_age(date, region, 'All'), window, delta=1e-6 * window + 1)
+
+            dates = range(min_date, max_date + 1, 997)
+            self.assertEqual(self.pop_day.pop_sum_age_series(dates, region, 'All').tolist(),
+                             [self.pop_day.pop_sum_age(date, region, 'All') for date in dates])
+
+    def test_rank_series(self):
+        # Test that the ranks of a person over a series of dates, which the bicubic model integrates all at once, are the single ranks
+        min_date, max_date = self.pop_day.get_date_range()
+        for region in sample(self.pop_year.get_regions(), 3):
+            dob = random.randint(min_date - 20000, max_date - 1000)
+            dates = range(max(dob, min_date), min(dob + 36500, max_date) + 1, 97)
+            for pop_day in (self.pop_day, self.pop_day_linear):
+                self.assertEqual(pop_day.pop_sum_dob_series(dates, region, 'All', dob).tolist(),
+                                 [pop_day.pop_sum_dob(date, region, 'All', dob, date) for date in dates])
+
+            # the bicubic integrals are the same when they are set up in chunks
+            expected = self.pop_day.pop_sum_dob_series(dates, region, 'All', dob).tolist()
+            self.pop_day.get_evaluator().DENSE_CHUNK = 7
+            self.assertEqual(self.pop_day.pop_sum_dob_series(dates, region, 'All', dob).tolist(), expected)
+            del self.pop_day.get_evaluator().DENSE_CHUNK
+
+    def test_region_ranks(self):
+        # Test that the ranks in all regions at once, from a single basis row, are the ranks in each region
+        regions = self.pop_year.get_regions()
+        min_date, max_date = self.pop_day.get_date_range()
+        cases = []
+        for date in [random.randint(min_date, max_date) for i in range(5)]:
+            dob = random.randint(date - 40000, date)
+            expected = [self.pop_day.pop_sum_dob(date, region, 'M', dob, date) for region in regions]
+            self.assertEqual(self.pop_day.pop_sum_dob_regions(date, regions, 'M', dob, date).tolist(), expected)
+            expected_linear = [self.pop_day_linear.pop_sum_dob(date, region, 'M', dob, date) for region in regions]
+            # without falling back to the region by region loop
+            self.pop_day_linear.pop_sum_dob = None
+            self.assertEqual(self.pop_day_linear.pop_sum_dob_regions(date, regions, 'M', dob, date).tolist(), expected_linear)
+            del self.pop_day_linear.pop_sum_dob
+            cases.append((date, dob, expected))
+
+        # once more from the coefficient tensor of build_all_models()
+        self.pop_day.build_all_models()
+        for date, dob, expected in cases:
+            self.assertEqual(self.pop_day.pop_sum_dob_regions(date, regions, 'M', dob, date).tolist(), expected)
+
+    def test_inverse_dates(self):
+        # Test that the dates of many ranks found at once are the ones found by the binary search for each rank
+        min_date, max_date = self.pop_day.get_date_range()
+        for region in sample(self.pop_year.get_regions(), 3):
+            dob = random.randint(min_date, max_date - 1000)
+            for pop_day in (self.pop_day, self.pop_day_linear):
+                lowest, highest = pop_day.pop_sum_dob_series([dob, max_date], region, 'F', dob)
+                pops = [0, lowest, highest] + sorted(random.sample(range(lowest, highest), 10))
+                self.assertEqual(pop_day.pop_sum_dob_inverse_dates(pops, region, 'F', dob).tolist(),
+                                 [pop_day.pop_sum_dob_inverse_date(pop, region, 'F', dob) for pop in pops])
+                self.assertRaises(ValueError, pop_day.pop_sum_dob_inverse_dates, [lowest, highest + 1], region, 'F', dob)
+
+    def test_compression(self):
+        # Test that the pyramid errors are the ones of test_knots, and that compressed splines stay within their error budget
+        region, sex = sample(self.pop_year.get_regions(), 1)[0], 'F'
+        errors = self.pop_day.pyramid_errors()
+        err_sum_pc_max = 0
+        for year in self.pop_year.dates():
+            date_days = population.to_epoch_days(datetime.date(year, 7, 1))
+            err_sum = sum(abs(self.pop_day.pop_sum_age(date_days, region, sex, int(age * population.DAYS_PER_YEAR), int((age + 1) * population.DAYS_PER_YEAR - 1)) -
+                              self.pop_year.pop_age(year, region, sex, age)) for age in self.pop_year.ages())
+            err_sum_pc_max = max(err_sum_pc_max, err_sum / float(self.pop_year.pop_sum_age(year, region, sex)))
+        self.assertAlmostEqual(errors[self.pop_day.region_code(region), self.pop_day.sex_code(sex)], err_sum_pc_max, delta=1e-6)
+
+        budget = 2 * errors.max()
+        compressed = population.BicubicSplineDailyPopulationModel(self.pop_year)
+        knot_step = compressed.compress(budget)
+        self.assertTrue(compressed.pyramid_errors().max() <= budget)
+        self.assertTrue(population.model_nbytes(compressed.get_model(region, sex)) < population.model_nbytes(self.pop_day.get_model(region, sex)))
+        print('compressed with knot step %s, max pyramid err %s%% instead of %s%%' % (knot_step, round(compressed.pyramid_errors().max()*100, 4), round(errors.max()*100, 4)))
+
+        # under a memory budget, fitting all splines keeps no tensor that the cached models are views on
+        budgeted = population.BicubicSplineDailyPopulationModel(self.pop_year, cache=population.ModelCache(max_bytes=10**9))
+        budgeted.build_all_models()
+        self.assertTrue(budgeted.coefficients is None)
+        self.assertFalse(np.may_share_memory(budgeted.get_model(region, 'F').tck[2], budgeted.get_model(region, 'M').tck[2]))
+        self.assertEqual(budgeted.pop_sum_age(16000, region, sex), self.pop_day.pop_sum_age(16000, region, sex))
+
+        # under a memory budget, the refitted splines are left to the cache
+        budgeted = population.BicubicSplineDailyPopulationModel(self.pop_year, cache=population.ModelCache(max_bytes=1))
+        self.assertEqual(budgeted.compress(budget), knot_step)
+        self.assertTrue(budgeted.coefficients is None)
+        self.assertEqual(budgeted.pop_sum_age(16000, region, sex), compressed.pop_sum_age(16000, region, sex))
+
+    def test_storage_precision(self):
+        # Test that the counts are kept exactly as int32, and that float32 models stay within a person of the float64 ones
+        pop_year32 = population.NpSingleYearPopulationModel("../data/WPP2012_INT_F3_Population_By_Sex_Annual_Single_100_Medium.csv", check_or_create_pickle=True, dtype='int32')
+        self.assertEqual(pop_year32.tensor.dtype, np.int32)
+        self.assertTrue((pop_year32.tensor == self.pop_year.tensor).all())
+
+        for model_class, pop_day in ((population.BicubicSplineDailyPopulationModel, self.pop_day), (population.LinearDailyPopulationModel, self.pop_day_linear)):
+            pop_day32 = model_class(pop_year32, dtype='float32')
+            min_date, max_date = pop_day.get_date_range()
+            for region in sample(self.pop_year.get_regions(), 5):
+                for date in [random.randint(min_date, max_date) for i in range(5)]:
+                    expected = pop_day.pop_sum_age(date, region, 'All')
+                    self.assertAlmostEqual(pop_day32.pop_sum_age(date, region, 'All'), expected, delta=1 + 1e-6 * expected)
+            self.assertTrue(population.model_nbytes(pop_day32.get_model(region, 'All')) < 0.6 * population.model_nbytes(pop_day.get_model(region, 'All')))
+
+    def test_linear_bicubic(self):
+        # Test that the fast linear model stays within its documented error bounds of the bicubic model,
+        # for the total population and for cohorts of a few years born on arbitrary days
+        min_date, max_date = self.pop_day.get_date_range()
+
+        table = list()
+        for region in sample(self.pop_year.get_regions(), 10):
+            for sex in self.pop_year.get_sexes():
+                max_total_pc_err = 0.0
+                max_cohort_err = 0
+                for date_days in range(min_date, max_date, 997):
+                    bicubic_total = self.pop_day.pop_sum_age(date_days, region, sex)
+                    linear_total = self.pop_day_linear.pop_sum_age(date_days, region, sex)
+                    if bicubic_total > 0:
+                        max_total_pc_err = max(max_total_pc_err, abs(linear_total - bicubic_total) / float(bicubic_total))
+
+                    dob_from = date_days - 3000 - date_days % 1000
+                    bicubic_cohort = self.pop_day.pop_sum_dob(date_days, region, sex, dob_from, dob_from + 1000)
+                    linear_cohort = self.pop_day_linear.pop_sum_dob(date_days, region, sex, dob_from, dob_from + 1000)
+                    max_cohort_err = max(max_cohort_err, abs(linear_cohort - bicubic_cohort))
+
+                self.assertLess(max_total_pc_err, 0.001)
+                table += [OrderedDict([
+                    ('region', region),
+                    ('sex', sex),
+                    ('max total err %', round(max_total_pc_err*100, 4)),
+                    ('max cohort err', max_cohort_err),
+                ])]
+
+        table.sort(key=lambda x: x['max total err %'])
+        print(tabulate(table, headers="keys"))
+
+
+class TestDateHelpers(unittest.TestCase):
+    # The vectorized date helpers must agree with their scalar counterparts
+
+    def setUp(self):
+        self.days = list(range(-30000, 50000, 97)) + [-7124, 0, 16071, 47664]
+
+    def test_epoch_days(self):
+        dates = [population.from_epoch_days(d) for d in self.days]
+        self.assertEqual(list(population.to_epoch_days_vec(dates)), self.days)
+        self.assertEqual(list(population.from_epoch_days_vec(self.days).astype(datetime.date)), dates)
+
+    def test_decimal_year(self):
+        for start_month, start_day in [(1, 1), (7, 1), (3, 1)]:
+            for days in [self.days, [d + 0.5 for d in self.days]]:
+                years, fracs = population.days_to_decimal_year_vec(days, start_month, start_day)
+                for d, year, frac in zip(days, years, fracs):
+                    self.assertEqual((year, frac), population.days_to_decimal_year(d, start_month, start_day))
+
+                back = population.decimal_year_to_days_vec(years, fracs, start_month, start_day)
+                for year, frac, d in zip(years, fracs, back):
+                    self.assertAlmostEqual(d, population.decimal_year_to_days(year, frac, start_month, start_day))
+
+
+class TestAggregations(unittest.TestCase):
+    # The generic aggregations of the base class are built on pop_age_vec(), check them on the toy model
+
+    def setUp(self):
+        self.pop_toy = population.LinearToyPopulationModel()
+
+    def test_pop_age_vec(self):
+        self.assertEqual(list(self.pop_toy.pop_age_vec(22, "World", "NA", [-1, 0, 2, 4, 5])), [0, 220000, 200000, 180000, 0])
+        self.assertEqual(list(self.pop_toy.pop_dob_vec(22, "World", "NA", [23, 22, 20, 18, 17])), [0, 220000, 200000, 180000, 0])
+        self.assertRaises(ValueError, self.pop_toy.pop_age_vec, 25, "World", "NA", [0])
+
+    def test_pop_sum(self):
+        for date in self.pop_toy.dates():
+            self.assertEqual(self.pop_toy.pop_sum_age(date, "World", "NA"), sum((date - age) * 10000 for age in range(0, 5)))
+            self.assertEqual(self.pop_toy.pop_sum_age(date, "World", "NA", 1, 3), sum((date - age) * 10000 for age in range(1, 4)))
+            self.assertEqual(self.pop_toy.pop_sum_dob(date, "World", "NA", date - 10, date - 3), sum((date - age) * 10000 for age in range(3, 5)))
+            self.assertEqual(self.pop_toy.pop_sum_dob(date, "World", "NA"), self.pop_toy.pop_sum_age(date, "World", "NA"))
+
+
+class TestModelCache(unittest.TestCase):
+    # The model cache is tested with plain numpy arrays standing in for fitted splines
+
+    def make_model(self, nbytes):
+        return population.np.zeros(nbytes // 8)
+
+    def test_unbounded(self):
+        cache = population.ModelCache()
+        for i in range(10):
+            cache.put(('Region %i' % i, 'All'), self.make_model(800))
+        self.assertEqual(len(cache), 10)
+        self.assertEqual(cache.stats()['bytes'], 8000)
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+    def test_lru(self):
+        cache = population.ModelCache(max_bytes=2400, policy='lru')
+        cache.put(('A', 'All'), self.make_model(800))
+        cache.put(('B', 'All'), self.make_model(800))
+        cache.put(('C', 'All'), self.make_model(800))
+        cache.get(('A', 'All'))
+        cache.put(('D', 'All'), self.make_model(800))
+        self.assertTrue(('A', 'All') in cache)
+        self.assertFalse(('B', 'All') in cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertRaises(KeyError, cache.get, ('B', 'All'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_lfu(self):
+        cache = population.ModelCache(max_bytes=2400, policy='lfu')
+        cache.put(('A', 'All'), self.make_model(800))
+        cache.put(('B', 'All'), self.make_model(800))
+        cache.put(('C', 'All'), self.make_model(800))
+        for i in range(3):
+            cache.get(('A', 'All'))
+            cache.get(('B', 'All'))
+        cache.get(('C', 'All'))
+        cache.put(('D', 'All'), self.make_model(800))
+        self.assertFalse(('C', 'All') in cache)
+        self.assertTrue(('D', 'All') in cache)
+
+    def test_pinned(self):
+        cache = population.ModelCache(max_bytes=1600, pinned=('World',))
+        cache.put(('World', 'M'), self.make_model(800))
+        cache.put(('World', 'F'), self.make_model(800))
+        cache.put(('A', 'All'), self.make_model(800))
+        self.assertTrue(('World', 'M') in cache)
+        self.assertTrue(('World', 'F') in cache)
+        self.assertTrue(('A', 'All') in cache) # the newest model is kept even if the budget is exhausted by pinned ones
+        cache.put(('B', 'All'), self.make_model(800))
+        self.assertFalse(('A', 'All') in cache)
+        self.assertEqual(cache.stats()['pinned_entries'], 2)
+        cache.pin(['B'])
+        self.assertEqual(cache.stats()['pinned_entries'], 3)
+
+    def test_concurrent_misses_build_once(self):
+        cache = population.ModelCache()
+        builds = []
+        def build():
+            builds.append(1)
+            time.sleep(0.1)
+            return self.make_model(800)
+
+        threads = [threading.Thread(target=cache.get_or_build, args=(('World', 'All'), build)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(len(cache), 1)
+
 if __name__ == '__main__':
     unittest.main()
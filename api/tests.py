@@ -1,12 +1,21 @@
+import gzip, io, json, os, tempfile, time
 from datetime import date, timedelta
+import numpy as np
+import pandas as pd
 from unittest.case import skip
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.test import SimpleTestCase
 from rest_framework.test import APISimpleTestCase
-from api.algorithms import worldPopulationRankByDate, dateByWorldPopulationRank, lifeExpectancyRemaining, populationCount, \
-    lifeExpectancyTotal, totalPopulation, calculateMortalityDistribution
-from api.datastore import dataStore
+from api.algorithms import worldPopulationRankByDate, worldPopulationRanksByCountry, worldPopulationRankTrajectory, dateByWorldPopulationRank, datesByWorldPopulationRanks, lifeExpectancyRemaining, populationCount, \
+    lifeExpectancyTotal, totalPopulation, totalPopulationSeries, continentPopulation, groupPopulation, continentBirthsByDate, birthsSeries, \
+    calculateMortalityDistribution, CONTINENTS, COUNTRIES
+from api.datastore import dataStore, DailyBirthsIndex, UMASK
 from api.exceptions import *
+from api.offload import ComputePool
+from api.decorators import expect_params, normalize_date, normalize_offset
+from api.renderers import FastJSONRenderer, NDJSONRenderer, NpyRenderer
+from api.utils import RecordTable
 
 
 
@@ -57,6 +66,40 @@ class AlgorithmTests(SimpleTestCase):
     def test_byDate_calculationTooWide(self):
         self.assertRaises(CalculationTooWideError, worldPopulationRankByDate, 'unisex', 'World', date(1930, 1, 1), date(2031, 1, 1))
 
+    def test_byDate_allCountries(self):
+        ranks = list(worldPopulationRanksByCountry('unisex', date(1993, 12, 6), date(2014, 6, 1)))
+        self.assertEqual(sorted(COUNTRIES), sorted(entry['country'] for entry in ranks))
+        self.assertNotIn('World', COUNTRIES)
+        self.assertTrue(set(COUNTRIES) < set(dataStore.countries))
+        self.assertEqual(sorted(entry['rank'] for entry in ranks), [entry['rank'] for entry in ranks])
+        for entry in ranks[::50] + [entry for entry in ranks if entry['country'] == 'Estonia']:
+            self.assertEqual(entry['rank'], worldPopulationRankByDate('unisex', entry['country'], date(1993, 12, 6), date(2014, 6, 1)))
+        self.assertRaises(InvalidSexError, worldPopulationRanksByCountry, 'INVALID', date(1980, 1, 1), date(2000, 1, 1))
+        self.assertRaises(CalculationDateOutOfRangeError, worldPopulationRanksByCountry, 'unisex', date(1970, 1, 1), date(1960, 1, 1))
+
+    def test_byDate_trajectory(self):
+        trajectory = list(worldPopulationRankTrajectory('unisex', 'World', date(1993, 12, 6), date(2014, 6, 1), 'year'))
+        self.assertEqual(21, len(trajectory))
+        self.assertEqual(date(2013, 12, 6), trajectory[-1]['date'])
+        for entry in trajectory[::5]:
+            self.assertEqual(entry['rank'], worldPopulationRankByDate('unisex', 'World', date(1993, 12, 6), entry['date']))
+        monthly = list(worldPopulationRankTrajectory('female', 'Brazil', date(2000, 1, 31), date(2000, 6, 30), 'month', mode='fast'))
+        self.assertEqual([date(2000, 1, 31), date(2000, 2, 29), date(2000, 3, 31), date(2000, 4, 30), date(2000, 5, 31), date(2000, 6, 30)], [entry['date'] for entry in monthly])
+        self.assertEqual(monthly[-1]['rank'], worldPopulationRankByDate('female', 'Brazil', date(2000, 1, 31), date(2000, 6, 30), mode='fast'))
+        daily = list(worldPopulationRankTrajectory('male', 'World', date(1920, 1, 1), date(1950, 7, 10), 'day'))
+        self.assertEqual(date(1950, 7, 1), daily[0]['date'])   # the trajectory starts with the first date covered by the model
+        self.assertEqual(10, len(daily))
+        self.assertRaises(InvalidStrideError, worldPopulationRankTrajectory, 'unisex', 'World', date(1993, 12, 6), date(2014, 6, 1), 'week')
+        self.assertRaises(CalculationDateOutOfRangeError, worldPopulationRankTrajectory, 'unisex', 'World', date(1993, 12, 6), date(1993, 12, 5), 'day')
+        self.assertRaises(CalculationTooWideError, worldPopulationRankTrajectory, 'unisex', 'World', date(1930, 1, 1), date(2031, 1, 1), 'year')
+
+    def test_byDate_trajectory_longest(self):
+        # the longest daily trajectory, which is integrated in chunks of dates
+        trajectory = worldPopulationRankTrajectory('unisex', 'World', date(2000, 1, 1), date(2000, 1, 1) + timedelta(days=36500), 'day')
+        self.assertEqual(36501, len(trajectory))
+        for entry in list(trajectory)[::4999]:
+            self.assertEqual(entry['rank'], worldPopulationRankByDate('unisex', 'World', date(2000, 1, 1), entry['date']))
+
     def test_byRank(self):
         self.assertEqual(date(2049,  3, 11), dateByWorldPopulationRank('unisex', 'World', date(1993, 12,  6), 7000000000))
 
@@ -67,6 +110,15 @@ class AlgorithmTests(SimpleTestCase):
     def test_byRank_veryHighRank(self):
         self.assertEqual(date(2027, 11, 29), dateByWorldPopulationRank('unisex', 'World', date(2004, 11, 22), 3000000000))
 
+    def test_byRank_milestones(self):
+        milestones = list(datesByWorldPopulationRanks('unisex', 'World', date(1993, 12, 6), [3000000000, 7000000000, 1000000000000]))
+        self.assertEqual([3000000000, 7000000000, 1000000000000], [entry['rank'] for entry in milestones])
+        self.assertEqual(date(2049, 3, 11), milestones[1]['date'])
+        self.assertEqual(dateByWorldPopulationRank('unisex', 'World', date(1993, 12, 6), 3000000000), milestones[0]['date'])
+        self.assertEqual(None, milestones[2]['date'])   # not reached by 2100
+        self.assertRaises(DataOutOfRangeError, datesByWorldPopulationRanks, 'unisex', 'World', date(1993, 12, 6), [])
+        self.assertRaises(BirthdateOutOfRangeError, datesByWorldPopulationRanks, 'unisex', 'World', date(1915, 1, 1), [1000])
+
     def test_lifeExpectancyRemaining(self):
         self.assertAlmostEqual(28.53, lifeExpectancyRemaining('female', 'World', date(2049, 3, 11), relativedelta(years=55, months=4)), places=0)
         self.assertAlmostEqual(32.80, lifeExpectancyRemaining('male', 'United Kingdom', date(2001, 5, 11), relativedelta(years=49)), places=0)
@@ -91,11 +143,261 @@ class AlgorithmTests(SimpleTestCase):
         self.assertEqual(totalPopulation('United Kingdom', date(2013, 1, 1)), 62961264)
         self.assertEqual(totalPopulation('Afghanistan', date(2022, 12, 31)), 37599673)
         self.assertEqual(totalPopulation('World', date(2018, 7, 31)), 7569167368)
+
+    def test_total_population_fastMode(self):
+        # the fast model should stay within 0.05% of the accurate one for population totals
+        self.assertAlmostEqual(totalPopulation('United Kingdom', date(2013, 1, 1), mode='fast'), 62961264, delta=31500)
+        self.assertAlmostEqual(totalPopulation('World', date(2018, 7, 31), mode='fast'), 7569167368, delta=3785000)
+        self.assertRaises(InvalidModeError, totalPopulation, 'World', date(2018, 7, 31), mode='rough')
+
+    def test_total_population_series(self):
+        series = totalPopulationSeries('Afghanistan', date(2022, 11, 1), date(2022, 12, 31))
+        self.assertEqual(61, len(series))
+        self.assertEqual(date(2022, 12, 31), series[-1]['date'])
+        for entry in series[::10] + series[-1:]:
+            self.assertEqual(entry['population'], totalPopulation('Afghanistan', entry['date']))
+        self.assertEqual([{'date': date(2013, 1, 1), 'population': 62961264}], totalPopulationSeries('United Kingdom', date(2013, 1, 1), date(2013, 1, 1)))
+        self.assertRaises(CalculationDateOutOfRangeError, totalPopulationSeries, 'World', date(2018, 7, 31), date(2018, 7, 30))
+        self.assertRaises(CalculationDateOutOfRangeError, totalPopulationSeries, 'World', date(2018, 7, 31), date(2023, 1, 1))
+
+    def test_continent_population(self):
+        # the splines are linear in the data, so interpolating the sum gives the sum of the interpolations (up to rounding)
+        members = CONTINENTS['Europe']
+        self.assertTrue('Germany' in members and 'France' in members)
+        self.assertAlmostEqual(continentPopulation('Europe', date(2015, 3, 1)), sum(totalPopulation(country, date(2015, 3, 1)) for country in members), delta=len(members))
+        self.assertRaises(InvalidContinentError, continentPopulation, 'Atlantis', date(2015, 3, 1))
+
+    def test_group_population(self):
+        self.assertAlmostEqual(groupPopulation(['Brazil', 'Germany'], date(2015, 3, 1)), totalPopulation('Brazil', date(2015, 3, 1)) + totalPopulation('Germany', date(2015, 3, 1)), delta=2)
+        self.assertEqual(groupPopulation(['Germany', 'Brazil', 'Germany'], date(2015, 3, 1)), groupPopulation(['Brazil', 'Germany'], date(2015, 3, 1)))
+        self.assertEqual(groupPopulation(['Brazil'], date(2015, 3, 1)), totalPopulation('Brazil', date(2015, 3, 1)))
+        self.assertRaises(InvalidCountryError, groupPopulation, ['Brazil', 'Atlantis'], date(2015, 3, 1))
         
+    def test_continent_births(self):
+        births = continentBirthsByDate('Europe', date(1983, 12, 19))
+        self.assertEqual(sorted(CONTINENTS['Europe']), sorted(entry['country'] for entry in births))
+        self.assertTrue(all(entry['births'] >= 0 for entry in births))
+        self.assertRaises(InvalidContinentError, continentBirthsByDate, 'Atlantis', date(1983, 12, 19))
+        self.assertRaises(CalculationDateOutOfRangeError, continentBirthsByDate, 'Europe', date(1949, 12, 31))
+
+    def test_continent_births_unknown_country(self):
+        # countries of a continent that have no column in the births table are left out
+        members = CONTINENTS['Europe']
+        CONTINENTS['Europe'] = members + ['Atlantis']
+        try:
+            births = continentBirthsByDate('Europe', date(1983, 12, 19))
+            self.assertEqual(dataStore.births_day_country.knownCountries(members), [entry['country'] for entry in births])
+            total, series = birthsSeries('Europe', date(1983, 12, 1), date(1983, 12, 31))
+            self.assertAlmostEqual(series[18]['births'], sum(entry['births'] for entry in births))
+        finally:
+            CONTINENTS['Europe'] = members
+
+    def test_births_series(self):
+        total, series = birthsSeries('Europe', date(1983, 12, 1), date(1983, 12, 31))
+        self.assertEqual(31, len(series))
+        self.assertEqual(date(1983, 12, 19), series[18]['date'])
+        self.assertAlmostEqual(series[18]['births'], sum(entry['births'] for entry in continentBirthsByDate('Europe', date(1983, 12, 19))))
+        self.assertAlmostEqual(total, sum(entry['births'] for entry in series))
+        self.assertRaises(InvalidCountryError, birthsSeries, 'Atlantis', date(1983, 12, 1), date(1983, 12, 31))
+        self.assertRaises(CalculationDateOutOfRangeError, birthsSeries, 'Brazil', date(1983, 12, 1), date(1983, 11, 30))
+
     def test_mortality_distribution(self):
         self.assertEqual(calculateMortalityDistribution('Germany', 'male', relativedelta(years=43, months=3))[3][1],2.2179399450663992)            
 
 
+def unpicklableResult():
+    return lambda: None
+
+def slowResult(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class ComputePoolTests(SimpleTestCase):
+    """
+    Tests running calculations in worker processes.
+    """
+
+    def setUp(self):
+        self.pool = ComputePool(processes=1, maxPending=1)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_result(self):
+        self.assertEqual(worldPopulationRankByDate('unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)),
+                         self.pool.run(worldPopulationRankByDate, 'unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)))
+
+    def test_exception(self):
+        self.assertRaises(InvalidCountryError, self.pool.run, worldPopulationRankByDate, 'unisex', 'THIS COUNTRY DOES NOT EXIST', date(1980, 1, 1), date(2000, 1, 1))
+
+    def test_overloaded(self):
+        self.pool._slots.acquire()
+        self.assertRaises(ComputationOverloadedError, self.pool.run, worldPopulationRankByDate, 'unisex', 'World', date(1980, 1, 1), date(2014, 6, 1))
+        self.pool._slots.release()
+
+    def test_failure_frees_slot(self):
+        # a result that can't be sent back never reaches the pool's callbacks, yet its slot must be freed
+        self.assertRaises(Exception, self.pool.run, unpicklableResult)
+        self.assertEqual(worldPopulationRankByDate('unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)),
+                         self.pool.run(worldPopulationRankByDate, 'unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)))
+
+    def test_timeout_keeps_slot(self):
+        # a calculation that timed out holds its slot until it has finished in the worker
+        pool = ComputePool(processes=1, maxPending=1, timeout=1)
+        pool.start()
+        try:
+            self.assertRaises(ComputationOverloadedError, pool.run, slowResult, 3)
+            start = time.time()
+            self.assertRaises(ComputationOverloadedError, pool.run, slowResult, 0)
+            self.assertTrue(time.time() - start < 0.5)   # refused right away, rather than queued behind the running calculation
+            time.sleep(3)
+            self.assertEqual(0, pool.run(slowResult, 0))
+        finally:
+            pool.stop()
+
+    def test_inline(self):
+        self.assertEqual(worldPopulationRankByDate('unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)),
+                         ComputePool(processes=0).run(worldPopulationRankByDate, 'unisex', 'World', date(1980, 1, 1), date(2014, 6, 1)))
+
+
+class DailyBirthsIndexTests(SimpleTestCase):
+    """
+    Tests the births index on a small made-up table.
+    """
+
+    def setUp(self):
+        populationAgedZero = np.array([[10, 100], [12, 100], [15, 90], [15, 95], [20, 105]], dtype=float)
+        self.index = DailyBirthsIndex(1000, ['A', 'B'], populationAgedZero)
+
+    def test_births(self):
+        self.assertEqual(1003, self.index.lastDay)
+        self.assertEqual([2, 0], list(self.index.births(1000, self.index.countryIds(['A', 'B']))))
+        self.assertEqual([0, 5], list(self.index.births(1002, self.index.countryIds(['A', 'B']))))
+        self.assertEqual([10], list(self.index.births(1003, self.index.countryIds(['B']))))
+        self.assertRaises(IndexError, self.index.births, 1004, self.index.countryIds(['A']))
+        self.assertRaises(KeyError, self.index.countryIds, ['C'])
+
+    def test_range(self):
+        ids = self.index.countryIds(['B', 'A'])
+        self.assertEqual([15, 10], list(self.index.birthsSum(1000, 1003, ids)))
+        self.assertEqual([5, 3], list(self.index.birthsSum(1001, 1002, ids)))
+        self.assertEqual([[0, 3], [5, 0]], self.index.birthsSeries(1001, 1002, ids).tolist())
+        self.assertEqual(['B', 'A'], self.index.knownCountries(['B', 'C', 'A']))
+
+    def test_csv(self):
+        rows = [('1970/01/02', 10), ('1970/01/03', 12), ('1970/01/04', 15)]
+        for table, expectContiguous in ((rows, True), (rows[:1] + rows[2:], False), (rows[:2] + rows[1:], False)):
+            with tempfile.NamedTemporaryFile(suffix='.csv') as csv:
+                csv.write(',A,date1\n' + ''.join('%i,%i,%s\n' % (row, births, day) for row, (day, births) in enumerate(table)))
+                csv.flush()
+                if expectContiguous:
+                    self.assertEqual((date(1970, 1, 2), date(1970, 1, 3)), DailyBirthsIndex.fromCSV(csv.name).dateRange())
+                else:
+                    self.assertRaises(ValueError, DailyBirthsIndex.fromCSV, csv.name)
+
+
+class DataStoreTests(SimpleTestCase):
+    """
+    Tests storing the extrapolation tables.
+    """
+
+    def test_table_mode(self):
+        path = dataStore._buildExtrapolationTableFilename('test', 'Atlantis')
+        try:
+            dataStore.storeExtrapolationTable('test', 'Atlantis', pd.DataFrame({'date': [1, 2]}))
+            self.assertEqual(0o666 & ~UMASK, os.stat(path).st_mode & 0o777)
+        finally:
+            os.remove(path)
+
+
+class ParameterParsingTests(SimpleTestCase):
+    """
+    Tests the conversion of URL parameters.
+    """
+
+    def test_dates(self):
+        self.assertEqual(date(2015, 6, 1), normalize_date('date', '2015-06-01'))
+        self.assertEqual(date(2015, 6, 1), normalize_date('date', '2015-6-1'))
+        self.assertRaises(DateParsingError, normalize_date, 'date', '2015-02-30')
+        self.assertRaises(DateParsingError, normalize_date, 'date', '2015-06-01x')
+        self.assertRaises(DateParsingError, normalize_date, 'date', '2015-06-01\n')
+        self.assertRaises(DateParsingError, normalize_date, 'date', 'today')
+
+    def test_expect_params(self):
+        view = expect_params(dob=normalize_date, age=normalize_offset)(lambda request, **kwargs: kwargs)
+        self.assertEqual({'dob': date(1980, 1, 1), 'age': relativedelta(years=30, days=2), 'sex': 'male'},
+                         view(None, dob='1980-01-01', age='30y2d', sex='male'))
+        self.assertRaises(OffsetParsingError, view, None, dob='1980-01-01', age='30x')
+        self.assertRaises(RuntimeError, view, None, dob='1980-01-01')
+
+
+class RendererTests(SimpleTestCase):
+    """
+    Tests that the fast JSON renderer produces the same JSON as the standard one.
+    """
+
+    def test_record_table(self):
+        table = RecordTable(['country', 'year', 'total'], {'country': ['Brazil', 'World'], 'year': np.array([1980, 1981]), 'total': [np.int64(5), 0.5]})
+        records = [{'country': 'Brazil', 'year': 1980, 'total': 5}, {'country': 'World', 'year': 1981, 'total': 0.5}]
+        self.assertEqual(records, list(table))
+        self.assertEqual(records[1], table[1])
+        self.assertEqual(json.loads(FastJSONRenderer().render(records)), json.loads(FastJSONRenderer().render(table)))
+        self.assertEqual(records, json.loads(FastJSONRenderer().render(table, 'application/json; indent=4')))
+
+    def test_streaming(self):
+        table = RecordTable(['age', 'total'], {'age': np.arange(1001), 'total': np.arange(1001) * 2})
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render(table), ''.join(renderer.renderStream(table)))
+        self.assertEqual('[]', ''.join(renderer.renderStream(RecordTable(['age'], {'age': []}))))
+        self.assertEqual(list(table), [json.loads(line) for line in NDJSONRenderer().render(table).splitlines()])
+
+    def test_npy(self):
+        records = [{'age': 1, 'mortality_percent': 0.5, 'country': 'Brazil'}, {'age': 2, 'mortality_percent': 1.5, 'country': 'World'}]
+        array = np.load(io.BytesIO(NpyRenderer().render({'mortality_distribution': records})))
+        self.assertEqual([1, 2], array['age'].tolist())
+        self.assertEqual([0.5, 1.5], array['mortality_percent'].tolist())
+        self.assertEqual(['Brazil', 'World'], array['country'].tolist())
+        self.assertEqual({'rank': 5}, json.loads(NpyRenderer().render({'rank': 5})))
+
+    def test_numpy(self):
+        self.assertEqual({'rank': 3, 'values': [0.5, 1.0]}, json.loads(FastJSONRenderer().render({'rank': np.int64(3), 'values': np.array([0.5, 1])})))
+
+
+class CompressionTests(APISimpleTestCase):
+    """
+    Tests the compression of responses and the precompressed documentation.
+    """
+
+    def _decompress(self, response):
+        return gzip.GzipFile(fileobj=io.BytesIO(response.content)).read()
+
+    def test_large_response(self):
+        plain = self.client.get('/1.0/population/Brazil/18/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        compressed = self.client.get('/1.0/population/Brazil/18/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', compressed['Content-Encoding'])
+        self.assertTrue('Accept-Encoding' in compressed['Vary'])
+        self.assertEqual(plain.content, self._decompress(compressed))
+
+    def test_small_response(self):
+        response = self.client.get('/1.0/countries/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(response.content) >= settings.COMPRESSION_MIN_BYTES, response.has_header('Content-Encoding'))
+
+    def test_docs(self):
+        with open(os.path.join(settings.BASE_DIR, 'static', 'swagger-ui', 'index.html'), 'rb') as index:
+            content = index.read()
+        self.assertEqual(content, self.client.get('/').content)
+        self.assertEqual(content, self._decompress(self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')))
+        response = self.client.get('/static/docs/api-docs', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertEqual('application/json', response['Content-Type'])
+        self.assertTrue('apis' in json.loads(response.content))
+        self.assertEqual(404, self.client.get('/static/docs/missing').status_code)
+        births = self.client.get('/static/docs/resources/births', HTTP_ACCEPT_ENCODING='gzip;q=0').content
+        self.assertTrue('Valid dates are %s to %s.' % dataStore.births_day_country.dateRange() in births)
+
+
 class ApiIntegrationTests(APISimpleTestCase):
     """
     A set of test cases testing the whole stack, from the url routing to the request processing to delivering the right status code. Do not check any returned data.
@@ -128,6 +430,26 @@ class ApiIntegrationTests(APISimpleTestCase):
     def testRankEndpointAged_invalidOffset(self):
         self._testEndpoint('/wp-rank/1952-03-11/unisex/World/aged/5x/', expectErrorContaining='offset')
 
+    def testRankEndpointTrajectory(self):
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/trajectory/2015-03-11/month/')
+        self._testEndpoint('/wp-rank/1952-03-11/male/United%20Kingdom/trajectory/2015-03-11/day/?mode=fast')
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/trajectory/2015-03-11/week/', expectErrorContaining='stride')
+        response = self.client.get('/1.0/wp-rank/1952-03-11/unisex/World/trajectory/2015-03-11/year/', HTTP_ACCEPT='application/x-npy')
+        self.assertEqual(response['Content-Type'], 'application/x-npy')
+        self.assertEqual(64, len(np.load(io.BytesIO(response.content))['rank']))
+
+    def testRankEndpointAllCountries(self):
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/countries/on/2001-09-11/')
+        self._testEndpoint('/wp-rank/1952-03-11/female/countries/on/2001-09-11/?mode=fast')
+        self._testEndpoint('/wp-rank/1952-03-11/123/countries/on/2001-09-11/', expectErrorContaining='sex')
+
+    def testRankEndpointMilestones(self):
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/milestones/1000000000+2000000000+3000000000/')
+        self._testEndpoint('/wp-rank/1952-03-11/female/Brazil/milestones/10000000/?mode=fast')
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/milestones/1000000000+2x/', expectErrorContaining='ranks')
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/milestones/1000000000+99999999999999999999/', expectErrorContaining='ranks')
+        self._testEndpoint('/wp-rank/1952-03-11/unisex/World/milestones/%s/' % '+'.join(['1000'] * 101), expectErrorContaining='ranks')
+
     def testPopulationEndpoint_successCountryAndAgeOnly(self):
         self._testEndpoint('/population/Brazil/18/')
 
@@ -137,14 +459,56 @@ class ApiIntegrationTests(APISimpleTestCase):
     def testPopulationEndpoint_successYearAndCountryOnly(self):
         self._testEndpoint('/population/1980/Brazil/')
 
+    def testPopulationEndpoint_streaming(self):
+        expected = json.loads(self.client.get('/1.0/population/Brazil/18/').content)
+        response = self.client.get('/1.0/population/Brazil/18/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(expected, [json.loads(line) for line in ''.join(response.streaming_content).splitlines()])
+        response = self.client.get('/1.0/population/Brazil/18/?stream=true')
+        self.assertEqual(expected, json.loads(''.join(response.streaming_content)))
+
+    def testPopulationEndpoint_npy(self):
+        expected = json.loads(self.client.get('/1.0/population/Brazil/18/').content)
+        response = self.client.get('/1.0/population/Brazil/18/', HTTP_ACCEPT='application/x-npy')
+        self.assertEqual(response['Content-Type'], 'application/x-npy')
+        self.assertEqual([row['total'] for row in expected], np.load(io.BytesIO(response.content))['total'].tolist())
+        response = self.client.get('/1.0/population/Atlantis/18/', HTTP_ACCEPT='application/x-npy')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertTrue('country' in json.loads(response.content)['detail'])
+
     def testPopulationEndpoint_totalPopulation(self):
         self._testEndpoint('/population/Brazil/today-and-tomorrow/')
         self._testEndpoint('/population/United%20Kingdom/2015-11-12/')
 
+    def testPopulationEndpoint_totalPopulation_mode(self):
+        self._testEndpoint('/population/United%20Kingdom/2015-11-12/?mode=fast')
+        self._testEndpoint('/population/United%20Kingdom/2015-11-12/?mode=rough', expectErrorContaining='mode')
+
     def testPopulationEndpoint_totalPopulation_outOfRange(self):
         self._testEndpoint('/population/Brazil/2012-12-31/', expectErrorContaining='calculation date')
         self._testEndpoint('/population/Brazil/2023-01-01/', expectErrorContaining='calculation date')
 
+    def testPopulationEndpoint_totalPopulationSeries(self):
+        self._testEndpoint('/population/Brazil/2015-01-01/2015-12-31/')
+        self._testEndpoint('/population/United%20Kingdom/2015-01-01/2015-01-01/?mode=fast')
+        self._testEndpoint('/population/Brazil/2015-01-01/2014-12-31/', expectErrorContaining='calculation date')
+        self._testEndpoint('/population/Brazil/2012-12-31/2013-01-31/', expectErrorContaining='calculation date')
+
+    def testContinentPopulationEndpoint(self):
+        self._testEndpoint('/continent-population/Europe/2015-11-12/')
+        self._testEndpoint('/continent-population/Atlantis/2015-11-12/', expectErrorContaining='continent')
+
+    def testBirthsEndpoints(self):
+        self._testEndpoint('/continent-births/Europe/1983-12-19/')
+        self._testEndpoint('/continent-births/Atlantis/1983-12-19/', expectErrorContaining='continent')
+        self._testEndpoint('/births/Brazil/2015-01-01/2015-12-31/')
+        self._testEndpoint('/births/Europe/2015-01-01/2015-12-31/')
+        self._testEndpoint('/births/Europe/2015-01-01/2101-01-01/', expectErrorContaining='calculation date')
+
+    def testGroupPopulationEndpoint(self):
+        self._testEndpoint('/group-population/Brazil+United%20Kingdom+Germany/2015-11-12/')
+        self._testEndpoint('/group-population/Brazil+Atlantis/2015-11-12/', expectErrorContaining='country')
+
     def testLifeExpectancyRemainingEndpoint_successMaxDate(self):
         self._testEndpoint('/life-expectancy/remaining/female/World/2094-12-31/100y/')
 
@@ -190,6 +554,9 @@ class ApiIntegrationTests(APISimpleTestCase):
     def testMortalityDistribution(self):
         self._testEndpoint('/mortality-distribution/United%20Kingdom/male/49y2m/today/')
 
+    def testModelCacheStatus(self):
+        self._testEndpoint('/status/model-cache/')
+
 
 @skip
 class AlgorithmAcceptanceTests(SimpleTestCase):
@@ -1,4 +1,4 @@
-from django.conf.urls import url
+from django.conf.urls import url, include
 from api import views
 
 
@@ -6,27 +6,47 @@ WP_RANK_PREFIX = r'wp-rank/'
 PERSON_PATH = r'(?P<dob>[^/]+)/(?P<sex>[^/]+)/(?P<country>[^/]+)/'
 
 
+# the rank routes get the most traffic, so they are resolved first and in two steps: the person path is matched once, and only the
+# remainder of the URL is tried against each of the rank patterns
+wp_rank_patterns = [
+    url(r'^today/', views.world_population_rank_today),
+    url(r'^on/(?P<date>[^/]+)/', views.world_population_rank_by_date),
+    url(r'^aged/(?P<age>[^/]+)/', views.world_population_rank_by_age),
+    url(r'^ago/(?P<offset>[^/]+)/', views.world_population_rank_in_past),
+    url(r'^in/(?P<offset>[^/]+)/', views.world_population_rank_in_future),
+    url(r'^ranked/(?P<rank>[^/]+)/', views.date_by_world_population_rank),
+    url(r'^milestones/(?P<ranks>[^/]+)/', views.dates_by_world_population_ranks),
+    url(r'^trajectory/(?P<date>[^/]+)/(?P<stride>[^/]+)/', views.world_population_rank_trajectory),
+]
+
+
 urlpatterns = [
+    # /api/1.0/wp-rank/
+    # the ranks in all countries have to come first, as the person path would take "countries" for a country
+    url(r'^' + WP_RANK_PREFIX + r'(?P<dob>[^/]+)/(?P<sex>[^/]+)/countries/on/(?P<date>[^/]+)/', views.world_population_ranks_by_country),
+    url(r'^' + WP_RANK_PREFIX + PERSON_PATH, include(wp_rank_patterns)),
+
     # /api/1.0/countries/
     url(r'countries/', views.list_countries),
 
+    # /api/1.0/continent-population/ and /api/1.0/group-population/
+    # these have to come before the population patterns, which would match them as well
+    url(r'continent-population/(?P<continent>[^/]+)/(?P<refdate>[^/]+)/', views.retrieve_total_population_continent),
+    url(r'group-population/(?P<countries>[^/]+)/(?P<refdate>[^/]+)/', views.retrieve_total_population_group),
+
     # /api/1.0/population/
+    # the date series has to come first, as the year/country/age pattern would match it as well
+    url(r'population/(?P<country>[^/]+)/(?P<date_from>\d{4}-\d{2}-\d{2})/(?P<date_to>\d{4}-\d{2}-\d{2})/', views.retrieve_total_population_series),
     url(r'population/(?P<year>[^/]+)/aged/(?P<age>[^/]+)/', views.retrieve_population_table),
     url(r'population/(?P<year>[^/]+)/(?P<country>[^/]+)/(?P<age>[^/]+)/', views.retrieve_population_table),
     url(r'population/(?P<year>\d+)/(?P<country>[^/]+)/', views.retrieve_population_table),
     url(r'population/(?P<country>[^/]+)/(?P<age>\d+)/', views.retrieve_population_table),
     url(r'population/(?P<country>[^/]+)/today-and-tomorrow/', views.retrieve_total_population_now),
     url(r'population/(?P<country>[^/]+)/(?P<refdate>[^/]+)/', views.retrieve_total_population),
-    
-    url(r'continent-population/(?P<continent>[^/]+)/(?P<refdate>[^/]+)/', views.retrieve_total_population_continent),
 
-    # /api/1.0/wp-rank/
-    url(r'wp-rank/' + PERSON_PATH + r'today/', views.world_population_rank_today),
-    url(r'wp-rank/' + PERSON_PATH + r'on/(?P<date>[^/]+)/', views.world_population_rank_by_date),
-    url(r'wp-rank/' + PERSON_PATH + r'aged/(?P<age>[^/]+)/', views.world_population_rank_by_age),
-    url(r'wp-rank/' + PERSON_PATH + r'ago/(?P<offset>[^/]+)/', views.world_population_rank_in_past),
-    url(r'wp-rank/' + PERSON_PATH + r'in/(?P<offset>[^/]+)/', views.world_population_rank_in_future),
-    url(r'wp-rank/' + PERSON_PATH + r'ranked/(?P<rank>[^/]+)/', views.date_by_world_population_rank),
+    # /api/1.0/births/
+    url(r'continent-births/(?P<continent>[^/]+)/(?P<refdate>[^/]+)/', views.retrieve_continent_births),
+    url(r'births/(?P<region>[^/]+)/(?P<date_from>[^/]+)/(?P<date_to>[^/]+)/', views.retrieve_births_series),
 
     # /api/1.0/life-expectancy/
     url(r'life-expectancy/remaining/(?P<sex>[^/]+)/(?P<country>[^/]+)/(?P<date>[^/]+)/(?P<age>[^/]+)/', views.calculate_remaining_life_expectancy),
@@ -34,4 +54,7 @@ urlpatterns = [
 
     # /api/1.0/mortality-distribution/
     url(r'mortality-distribution/(?P<country>[^/]+)/(?P<sex>[^/]+)/(?P<age>[^/]+)/today/', views.calculate_mortality_distribution),
+
+    # /api/1.0/status/
+    url(r'status/model-cache/', views.model_cache_status),
 ]
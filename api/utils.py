@@ -1,9 +1,15 @@
-import datetime, re, math
+import datetime, re, math, threading
 from dateutil.relativedelta import relativedelta
 
 
 
+DATE_REGEX = re.compile(r'(\d{4})-(\d{2})-(\d{2})\Z')
 def str_to_date(param_name, date_string):
+    # the canonical YYYY-MM-DD format is parsed directly, which is several times faster than strptime, while strptime still handles
+    # everything else it accepts (e.g. dates without zero padding) and raises the ValueError for invalid dates
+    re_result = DATE_REGEX.match(date_string)
+    if re_result:
+        return datetime.date(*(int(x) for x in re_result.groups()))
     return datetime.datetime.strptime(date_string, '%Y-%m-%d').date()
 
 OFFSET_REGEX = re.compile(r'^(?:(?P<years>\d+)y)?(?:(?P<months>\d+)m)?(?:(?P<days>\d+)d)?$')
@@ -27,3 +33,115 @@ def decimal_years_to_relativedelta(years_float):
 
 def relativedelta_to_decimal_years(offset):
     return offset.years * 1.0 + offset.months / 12.0 + offset.days / 365.0
+
+
+class CodeRegistry(object):
+    """ Assigns stable, small integer codes to names (e.g. the regions or sexes of a population model) in the order they are added, so
+        that data can be kept in arrays indexed by code. Looking up a code and testing membership are hash lookups.
+    """
+
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self.names = []
+        self._codes = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        """ Returns the code of name, assigning the next free code if it is new. The name is stored before its code is published, so
+            that readers never see a code they can't resolve.
+        """
+        with self._lock:
+            if name not in self._codes:
+                self.names.append(name)
+                self._codes[name] = len(self.names) - 1
+            return self._codes[name]
+
+    def code(self, name):
+        """ Returns the code of name, raising a KeyError if it is unknown. """
+        return self._codes[name]
+
+    def name(self, code):
+        return self.names[code]
+
+    def __contains__(self, name):
+        return name in self._codes
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class RecordTable(object):
+    """ A table of records kept as columns (numpy arrays or lists) rather than as a list of dicts. It iterates and indexes like a list
+        of dicts, while the JSON renderer encodes it straight from the columns (see api.renderers.FastJSONRenderer).
+    """
+
+    def __init__(self, fields, columns):
+        """
+        :param fields: the field names, in the order of the rendered records
+        :param columns: a dict mapping every field name to a sequence of values, all of the same length
+        """
+        self.fields = list(fields)
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __getitem__(self, index):
+        return dict((field, _toPython(self.columns[field][index])) for field in self.fields)
+
+    def __iter__(self):
+        values = [_toPython(self.columns[field]) for field in self.fields]
+        return (dict(zip(self.fields, row)) for row in zip(*values))
+
+    def chunks(self, size):
+        """ Yields the table in consecutive slices of at most size records, as RecordTables sharing the columns of this one. """
+        for start in xrange(0, len(self), size):
+            yield RecordTable(self.fields, dict((field, column[start:start + size]) for field, column in self.columns.items()))
+
+def _toPython(value):
+    # converts numpy arrays and scalars to python lists and numbers
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+class SingleFlight(object):
+    """ Runs at most one call per key at a time: concurrent callers asking for a key that is already being computed wait for that
+        computation and share its result (or its exception) instead of starting their own.
+    """
+
+    class _Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,12 +1,15 @@
 import datetime
 from dateutil.relativedelta import relativedelta
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from api.datastore import dataStore
-from api.decorators import expect_date, expect_offset, expect_int, cache_until_utc_eod, cache_unlimited
+from api.decorators import expect_params, expect_int, normalize_date, normalize_offset, normalize_int, normalize_int_list, cache_until_utc_eod, cache_unlimited
 from api.utils import offset_to_str
-from api.algorithms import worldPopulationRankByDate, dateByWorldPopulationRank, lifeExpectancyRemaining, lifeExpectancyTotal, populationCount, \
-    totalPopulation, continentBirthsByDate, calculateMortalityDistribution
+from api.offload import computePool
+from api.algorithms import worldPopulationRankByDate, worldPopulationRanksByCountry, worldPopulationRankTrajectory, dateByWorldPopulationRank, datesByWorldPopulationRanks, \
+    lifeExpectancyRemaining, lifeExpectancyTotal, populationCount, \
+    totalPopulation, totalPopulationSeries, continentPopulation, groupPopulation, continentBirthsByDate, birthsSeries, calculateMortalityDistribution, modelCacheStatistics
 
 
 @api_view(['GET'])
@@ -20,82 +23,109 @@ def list_countries(request):
 
 @api_view(['GET'])
 @cache_until_utc_eod()
-@expect_date('dob')
+@expect_params(dob=normalize_date)
 def world_population_rank_today(request, dob, sex, country):
     """ Calculates the world population rank of a person with the given date of birth, sex and country of origin as of today.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>Today's date is always based on the current time in the timezone UTC.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
     today = datetime.datetime.utcnow().date()
-    rank = worldPopulationRankByDate(sex, country, dob, today)
+    rank = computePool.run(worldPopulationRankByDate, sex, country, dob, today, mode=request.QUERY_PARAMS.get('mode'))
     return Response({"rank": rank, 'dob': dob, 'sex': sex, 'country': country})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('dob')
-@expect_date('date')
+@expect_params(dob=normalize_date, date=normalize_date)
 def world_population_rank_by_date(request, dob, sex, country, date):
     """ Calculates the world population rank of a person with the given date of birth, sex and country of origin on a certain date.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    rank = worldPopulationRankByDate(sex, country, dob, date)
+    rank = computePool.run(worldPopulationRankByDate, sex, country, dob, date, mode=request.QUERY_PARAMS.get('mode'))
     return Response({"rank": rank, 'dob': dob, 'sex': sex, 'country': country, 'date': date})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('dob')
-@expect_offset('age')
+@expect_params(dob=normalize_date, date=normalize_date)
+def world_population_ranks_by_country(request, dob, sex, date):
+    """ Calculates the world population ranks of a person with the given date of birth and sex on a certain date in every country, as if the person had been born there, ordered by the rank.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    ranks = computePool.run(worldPopulationRanksByCountry, sex, dob, date, mode=request.QUERY_PARAMS.get('mode'))
+    return Response({'ranks': ranks})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(dob=normalize_date, age=normalize_offset)
 def world_population_rank_by_age(request, dob, sex, country, age):
     """ Calculates the world population rank of a person with the given date of birth, sex and country of origin on a certain date as expressed by the person's age.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    rank = worldPopulationRankByDate(sex, country, dob, dob + age)
+    rank = computePool.run(worldPopulationRankByDate, sex, country, dob, dob + age, mode=request.QUERY_PARAMS.get('mode'))
     return Response({"rank": rank, 'dob': dob, 'sex': sex, 'country': country, 'age': offset_to_str(age)})
 
 
 @api_view(['GET'])
 @cache_until_utc_eod()
-@expect_date('dob')
-@expect_offset('offset')
+@expect_params(dob=normalize_date, offset=normalize_offset)
 def world_population_rank_in_past(request, dob, sex, country, offset):
     """ Calculates the world population rank of a person with the given date of birth, sex and country of origin on a certain date as expressed by an offset towards the past from today.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>Today's date is always based on the current time in the timezone UTC.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
     today = datetime.datetime.utcnow().date()
-    rank = worldPopulationRankByDate(sex, country, dob, today - offset)
+    rank = computePool.run(worldPopulationRankByDate, sex, country, dob, today - offset, mode=request.QUERY_PARAMS.get('mode'))
     return Response({"rank": rank, 'dob': dob, 'sex': sex, 'country': country, 'offset': offset_to_str(offset)})
 
 
 @api_view(['GET'])
 @cache_until_utc_eod()
-@expect_date('dob')
-@expect_offset('offset')
+@expect_params(dob=normalize_date, offset=normalize_offset)
 def world_population_rank_in_future(request, dob, sex, country, offset):
     """ Calculates the world population rank of a person with the given date of birth, sex and country of origin on a certain date as expressed by an offset towards the future from today.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>Today's date is always based on the current time in the timezone UTC.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
     today = datetime.datetime.utcnow().date()
-    rank = worldPopulationRankByDate(sex, country, dob, today + offset)
+    rank = computePool.run(worldPopulationRankByDate, sex, country, dob, today + offset, mode=request.QUERY_PARAMS.get('mode'))
     return Response({"rank": rank, 'dob': dob, 'sex': sex, 'country': country, 'offset': offset_to_str(offset)})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('dob')
-@expect_int('rank')
+@expect_params(dob=normalize_date, date=normalize_date)
+def world_population_rank_trajectory(request, dob, sex, country, date, stride):
+    """ Calculates the world population ranks of a person with the given date of birth, sex and country of origin over their lifetime, on every day, month or year (as given by the stride) from the date of birth up to a certain date.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    trajectory = computePool.run(worldPopulationRankTrajectory, sex, country, dob, date, stride, mode=request.QUERY_PARAMS.get('mode'))
+    return Response({'rank_trajectory': trajectory})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(dob=normalize_date, rank=normalize_int)
 def date_by_world_population_rank(request, dob, sex, country, rank):
     """ Calculates the day on which a person with the given date of birth, sex and country of origin has reached (or will reach) a certain world population rank.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    calcdate = dateByWorldPopulationRank(sex, country, dob, rank)
+    calcdate = computePool.run(dateByWorldPopulationRank, sex, country, dob, rank, mode=request.QUERY_PARAMS.get('mode'))
     return Response({'dob': dob, 'sex': sex, 'country': country, 'rank': rank, 'date_on_rank': calcdate})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('date')
-@expect_offset('age')
+@expect_params(dob=normalize_date, ranks=normalize_int_list)
+def dates_by_world_population_ranks(request, dob, sex, country, ranks):
+    """ Calculates the days on which a person with the given date of birth, sex and country of origin has reached (or will reach) each of several world population ranks (separated by "+"), such as the milestones 1000000000+2000000000+3000000000 (at most 100 ranks). The date is null for ranks that are not reached in the period covered by the data.<p>The world population rank is defined as the position of someone's birthday among the group of living people of the same sex and country of origin, ordered by date of birth increasing. The first person born is assigned rank #1.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    milestones = computePool.run(datesByWorldPopulationRanks, sex, country, dob, ranks, mode=request.QUERY_PARAMS.get('mode'))
+    return Response({'rank_milestones': milestones})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(date=normalize_date, age=normalize_offset)
 def calculate_remaining_life_expectancy(request, sex, country, date, age):
     """ Calculate remaining life expectancy of a person with given sex, country, and age at a given point in time.<p>
         Please see <a href="/">the full API browser</a> for more information.
@@ -106,7 +136,7 @@ def calculate_remaining_life_expectancy(request, sex, country, date, age):
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('dob')
+@expect_params(dob=normalize_date)
 def total_life_expectancy(request, sex, country, dob):
     """ Calculate total life expectancy of a person with given sex, country, and date of birth.<p>Note that this function is implemented based on the remaining life expectancy by picking a reference date based on an age of 35 years. It is therefore of limited accuracy.<p>
         Please see <a href="/">the full API browser</a> for more information.
@@ -124,6 +154,10 @@ def retrieve_population_table(request, country=None, age=None, year=None):
         Please see <a href="/">the full API browser</a> for more information.
     """
     result = populationCount(country, age, year)
+    # stream the rows as they are encoded to clients asking for NDJSON (Accept: application/x-ndjson or ?format=ndjson) or ?stream=true
+    renderer = request.accepted_renderer
+    if hasattr(renderer, 'renderStream') and (renderer.format == 'ndjson' or request.QUERY_PARAMS.get('stream') == 'true'):
+        return StreamingHttpResponse(renderer.renderStream(result), content_type=renderer.media_type)
     # FIXME: the API currently returns a flat JS array here, which is invalid JSON. The commented out line would fix this, but is currently deactivated as not to break the frontend!
     return Response(result)
     #return Response({"tables": result})
@@ -137,39 +171,88 @@ def retrieve_total_population_now(request, country):
     """
     today = datetime.datetime.utcnow().date()
     tomorrow = today + relativedelta(days=1)
-    population_today = {'date': today, 'population': totalPopulation(country, today)}
-    population_tomorrow = {'date': tomorrow, 'population': totalPopulation(country, tomorrow)}
-    return Response({'total_population': [population_today, population_tomorrow]})
+    return Response({'total_population': totalPopulationSeries(country, today, tomorrow, mode=request.QUERY_PARAMS.get('mode'))})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('refdate')
+@expect_params(refdate=normalize_date)
 def retrieve_total_population(request, country, refdate):
     """ Retrieve total population count for country on given date.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    result = {'date': refdate, 'population': totalPopulation(country, refdate)}
+    result = {'date': refdate, 'population': totalPopulation(country, refdate, mode=request.QUERY_PARAMS.get('mode'))}
     return Response({'total_population': result})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(date_from=normalize_date, date_to=normalize_date)
+def retrieve_total_population_series(request, country, date_from, date_to):
+    """ Retrieve total population count for country on every day from date_from to date_to (inclusive).<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    return Response({'total_population': totalPopulationSeries(country, date_from, date_to, mode=request.QUERY_PARAMS.get('mode'))})
     
 @api_view(['GET'])
 @cache_unlimited()
-@expect_date('refdate')
+@expect_params(refdate=normalize_date)
 def retrieve_total_population_continent(request, continent, refdate):
     """ Retrieve total population count for all countries of a continent on given date.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    result = {'date': refdate, 'population': continentBirthsByDate(continent, refdate)}
+    result = {'date': refdate, 'population': continentPopulation(continent, refdate, mode=request.QUERY_PARAMS.get('mode'))}
     return Response({'total_population': result})
 
 
 @api_view(['GET'])
 @cache_unlimited()
-@expect_offset('age')
+@expect_params(refdate=normalize_date)
+def retrieve_total_population_group(request, countries, refdate):
+    """ Retrieve total population count for a group of countries (separated by "+") on given date.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    result = {'date': refdate, 'population': groupPopulation(countries.split('+'), refdate, mode=request.QUERY_PARAMS.get('mode'))}
+    return Response({'total_population': result})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(refdate=normalize_date)
+def retrieve_continent_births(request, continent, refdate):
+    """ Retrieve the number of births on given date in all countries of a continent.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    countries = continentBirthsByDate(continent, refdate)
+    return Response({'date': refdate, 'continent': continent, 'births': sum(entry['births'] for entry in countries), 'countries': countries})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(date_from=normalize_date, date_to=normalize_date)
+def retrieve_births_series(request, region, date_from, date_to):
+    """ Retrieve the number of births on every day from date_from to date_to (inclusive) in a country or continent.<p>
+        Please see <a href="/">the full API browser</a> for more information.
+    """
+    total, series = birthsSeries(region, date_from, date_to)
+    return Response({'region': region, 'total_births': total, 'births': series})
+
+
+@api_view(['GET'])
+@cache_unlimited()
+@expect_params(age=normalize_offset)
 def calculate_mortality_distribution(request, country, sex, age):
     """ Retrieve mortality distribution for given country / sex / age.<p>
         Please see <a href="/">the full API browser</a> for more information.
     """
-    plain_distribution = calculateMortalityDistribution(country, sex, age)
+    plain_distribution = computePool.run(calculateMortalityDistribution, country, sex, age)
     mortality_distribution = [{'age': val[0], 'mortality_percent': val[1]} for val in plain_distribution]
     return Response({'mortality_distribution': mortality_distribution})
+
+
+@api_view(['GET'])
+def model_cache_status(request):
+    """ Report the state of the in-memory cache of daily population models (size, hit rate, evictions).<p>
+        Intended for monitoring the memory budget of a deployment, see settings.MODEL_CACHE_MAX_BYTES.
+    """
+    return Response({'model_cache': modelCacheStatistics()})
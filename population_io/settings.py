@@ -64,6 +64,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'api.compression.CompressionMiddleware',   # needs to come first, to compress the final response
     'corsheaders.middleware.CorsMiddleware',   # needs to come before CommonMiddleware
     'django.middleware.common.CommonMiddleware',
 )
@@ -113,10 +114,13 @@ STATICFILES_DIRS = (
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.AllowAny',),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
         'rest_framework.renderers.JSONPRenderer',
+        'api.renderers.NDJSONRenderer',
+        'api.renderers.NpyRenderer',
     ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.renderers.FastContentNegotiation',
 }
 
 
@@ -141,3 +145,34 @@ CSV_CONTINENT_COUNTRIES = os.path.join(CSV_DIR, 'continent_countries.csv')
 CSV_BIRTHS_DAY_COUNTRY = os.path.join(CSV_DIR, 'worldBirthsByDayAndCountry.csv')
 
 CACHE_CONTROL_MAXAGE = 24 * 60 * 60
+
+# Responses of at least this size are compressed (with brotli if installed, otherwise gzip) for clients accepting it
+COMPRESSION_MIN_BYTES = int(os.environ.get('POPULATIONIO_COMPRESSION_MIN_BYTES', '1024'))
+
+# Memory budget for the fitted daily population models (one spline per region and sex). When unset, every model stays in memory
+# once built; otherwise models are evicted according to MODEL_CACHE_POLICY ('lru' or 'lfu'), except those of the pinned regions.
+MODEL_CACHE_MAX_BYTES = int(os.environ['POPULATIONIO_MODEL_CACHE_MAX_BYTES']) if os.environ.get('POPULATIONIO_MODEL_CACHE_MAX_BYTES') else None
+MODEL_CACHE_POLICY = os.environ.get('POPULATIONIO_MODEL_CACHE_POLICY', 'lru')
+MODEL_CACHE_PINNED_REGIONS = ('World',)
+# Memory budget for the summed models of the groups of countries requested from /group-population/, which are kept per set of countries.
+GROUP_CACHE_MAX_BYTES = int(os.environ.get('POPULATIONIO_GROUP_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Storage types of the yearly population counts ('float64', 'int32' or 'float32') and of the fitted daily models ('float64' or 'float32').
+# The smaller types halve the memory of each worker; `python manage.py precisionreport` shows what they cost in accuracy.
+POPULATION_DTYPE = os.environ.get('POPULATIONIO_POPULATION_DTYPE', 'float64')
+MODEL_DTYPE = os.environ.get('POPULATIONIO_MODEL_DTYPE', 'float64')
+
+# When set, the bicubic splines are refitted with as few knots as keep their largest pyramid error (in percent, as printed by test_knots)
+# within this budget, which makes them smaller and quicker to evaluate (see README.md). Unset (the default) keeps the interpolating splines.
+DAILY_MODEL_MAX_PYRAMID_ERROR = float(os.environ['POPULATIONIO_MAX_PYRAMID_ERROR']) if os.environ.get('POPULATIONIO_MAX_PYRAMID_ERROR') else None
+
+# The CPU-heavy calculations can be run in a pool of worker processes, so that they don't block the threads serving cheap requests.
+# With 0 processes (the default), everything runs inline. At most COMPUTE_POOL_MAX_PENDING calculations (default: twice the number of
+# processes) are accepted at once, further ones are rejected with 503 Service Unavailable, as are calculations exceeding the timeout.
+COMPUTE_POOL_PROCESSES = int(os.environ.get('POPULATIONIO_COMPUTE_PROCESSES', '0'))
+COMPUTE_POOL_MAX_PENDING = int(os.environ.get('POPULATIONIO_COMPUTE_MAX_PENDING', '0'))
+COMPUTE_POOL_TIMEOUT = 30
+
+# The daily population model used unless a request asks for another one with the "mode" query parameter: 'accurate' (bicubic splines)
+# or 'fast' (bilinear interpolation, less accurate, see README.md).
+DAILY_MODEL_MODE = os.environ.get('POPULATIONIO_DAILY_MODEL_MODE', 'accurate')
@@ -1,15 +1,25 @@
+import os
+from django.conf import settings
 from django.conf.urls import patterns, include, url
-from django.http.response import HttpResponse
+from api.compression import PrecompressedFiles
+from api.datastore import dataStore
 import api.urls
 
 
 API_VERSION_PREFIX = r'^1.0/'
 
+# the swagger UI and the API documentation it reads, loaded and compressed once at startup, with the ranges of the data filled in
+DOCS_DIRECTORIES = ('swagger-ui', 'docs')
+DOCS_VARIABLES = dict(zip(('{{BIRTHS_FIRST_DATE}}', '{{BIRTHS_LAST_DATE}}'), map(str, dataStore.births_day_country.dateRange())))
+docsFiles = PrecompressedFiles(os.path.join(settings.BASE_DIR, 'static'), DOCS_DIRECTORIES, DOCS_VARIABLES)
+
 
 # FIXME: hack to make the swagger-ui index.html be served from /
 def docs_index(request):
-    with open('static/swagger-ui/index.html', 'r') as index:
-        return HttpResponse(index.read())
+    return docsFiles.serve(request, 'swagger-ui/index.html')
+
+def docs_file(request, path):
+    return docsFiles.serve(request, path)
 
 
 urlpatterns = patterns('',
@@ -18,4 +28,5 @@ urlpatterns = patterns('',
 
     # / (Swagger documentation)
     url(r'^$', docs_index),
+    url(r'^static/(?P<path>(?:%s)/.+)$' % '|'.join(DOCS_DIRECTORIES), docs_file),
 )
@@ -12,4 +12,17 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "population_io.settings")
 
 from django.core.wsgi import get_wsgi_application
 from dj_static import Cling
-application = Cling(get_wsgi_application())
+
+class DocsCling(Cling):
+    """ Leaves the documentation files to Django, which serves them precompressed from memory (see population_io.urls.docsFiles). """
+    def _should_handle(self, path):
+        from population_io.urls import docsFiles
+        return super(DocsCling, self)._should_handle(path) and path[len(self.base_url[2]):] not in docsFiles
+
+application = DocsCling(get_wsgi_application())
+
+# load the models and fork the calculation worker processes before any request threads exist, so that the workers share the loaded
+# models with this process
+import api.algorithms
+from api.offload import computePool
+computePool.start()